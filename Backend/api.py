@@ -2,19 +2,27 @@ from fastapi import FastAPI, UploadFile, File, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware  # Import CORS middleware
 from pydantic import BaseModel
 from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
-import pandas as pd
-from io import BytesIO, StringIO
+from fastapi.concurrency import run_in_threadpool
 import os
-from langgraph.checkpoint.memory import MemorySaver
-from new_agent_llm import Agent
+import time
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import config
+from conversation_store import ConversationStore
+from new_agent_llm import Agent, llm_stats
 from data_extractor import DataExtractor
+from session_manager import SessionManager
+from fast_router import router_stats
+from response_cache import response_cache, CACHEABLE_ROUTES
+from streaming import StreamEventsHandler, sse_event, stream_from_thread
+from export import export_table, EXPORT_FORMATS
+from chart_cache import chart_folder, touch, chart_cache_stats
 from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage
-import dataframe_image as dfi
-from utils import dataframe_to_image, create_user_chart_zip
+from utils import data_head_image, data_head_json, list_user_charts, update_chart_zip, build_chart_zip, spool_upload, read_csv_file
 from uuid import uuid4  # To generate unique thread IDs
 
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
 app = FastAPI()
 
 # Add CORS middleware to allow frontend access
@@ -30,163 +38,365 @@ app.add_middleware(
 class PromptRequest(BaseModel):
     prompt: str
 
-# In-memory session store for user-specific data
-session_store = {}
+class CheckpointRequest(BaseModel):
+    name: str
 
-# Function to get session for a specific user
+# Model, tool bindings and compiled graph are built once and shared by every session,
+# the user's DataExtractor is passed to the graph through its config
+model = ChatOllama(model=config.OLLAMA_MODEL,base_url=config.OLLAMA_BASE_URL, temperature=0, keep_alive=config.OLLAMA_KEEP_ALIVE)
+tool_schemas = DataExtractor.tool_schemas()
+agent = Agent(
+    model=model,
+    business_description="business_description", 
+    data_modifications_tools=tool_schemas.data_modifications_tools,
+    process_na_value_tools=tool_schemas.process_na_values_tools,
+    data_analysis_tools=tool_schemas.data_analysis_tools,
+    data_graphics_tools=tool_schemas.data_graphics_tools,
+    system='',
+    checkpointer=ConversationStore()
+)
+
+# Build the session around a user's dataset. The conversation itself is kept by the
+# agent's checkpointer under the thread id.
+def start_session(user_id: str, data_extractor: DataExtractor, thread_id: str = None):
+    return {
+        'data_extractor': data_extractor,
+        'thread_id': thread_id or str(uuid4()),  # Generate a unique thread ID
+    }
+
+# One lock per user so the requests of a session are processed in order
+user_locks = {}
+
+def user_lock(user_id: str):
+    return user_locks.setdefault(user_id, asyncio.Lock())
+
+def user_busy(user_id: str):
+    # A request of the user holds its lock, its session must not be evicted
+    lock = user_locks.get(user_id)
+    return lock is not None and lock.locked()
+
+# Bounded session store: LRU/TTL eviction to disk and transparent rehydration.
+# The conversation of a session replaced by a new upload is deleted.
+sessions = SessionManager(start_session, on_replace=agent.forget_thread, is_busy=user_busy)
+
+# Function to get session for a specific user. Called under the user's lock; it may
+# rehydrate the dataset, so async handlers run it on the threadpool.
 def get_session(user_id: str):
-    if user_id not in session_store:
-        session_store[user_id] = {}
-    return session_store[user_id]
+    return sessions.get(user_id)
+
+async def session_data_extractor(user_id: str):
+    session = await run_in_threadpool(get_session, user_id)
+    return session.get('data_extractor')
+
+# Agent runs (Ollama calls, pandas work, chart rendering) are blocking, they run on a
+# bounded pool instead of the event loop
+chat_executor = ThreadPoolExecutor(max_workers=config.CHAT_WORKERS, thread_name_prefix='chat')
+
+# Chart archives are written under their own lock, a download does not wait for a chat
+download_locks = {}
+
+def download_lock(user_id: str):
+    return download_locks.setdefault(user_id, asyncio.Lock())
 
 # CSV upload and bot initialization endpoint
 @app.post("/upload-csv/{user_id}")
 async def upload_csv(user_id: str, file: UploadFile = File(...)):
+    csv_path = None
     try:
-        # Read the CSV file from the uploaded file
-        contents = await file.read()
-        df = pd.read_csv(BytesIO(contents))  # Load the CSV file into a pandas dataframe
+        timings = {}
 
-        # Store the dataframe in the session for the user
-        session = get_session(user_id)
-        session['dataframe'] = df
-
-        # Initialize the data extractor with the dataframe
-        data_extractor = DataExtractor(df, user_id)  # Adjust 'sales' to your target column
- 
-        # Initialize the ChatOllama model and Agent
-        model = ChatOllama(model='llama3.1:latest',base_url='http://ollama:11434', temperature=0)
-        bot = Agent(
-            model=model,
-            business_description="business_description", 
-            data_extractor=data_extractor,
-            data_modifications_tools=data_extractor.data_modifications_tools,
-            process_na_value_tools=data_extractor.process_na_values_tools,
-            data_analysis_tools=data_extractor.data_analysis_tools,
-            data_graphics_tools=data_extractor.data_graphics_tools,
-            system='',
-            checkpointer=MemorySaver()
-        )
-        
-        # Generate and store a unique thread_id for the user
-        thread_id = str(uuid4())  # Generate a unique thread ID
-        session['bot'] = bot
-        session['thread_id'] = thread_id  # Store the thread ID in the session
+        # Spool the uploaded file to disk in chunks
+        start = time.perf_counter()
+        csv_path = await spool_upload(file, user_id)
+        timings['receive'] = time.perf_counter() - start
 
-        return JSONResponse(content={"message": "CSV uploaded and bot initialized successfully."})
+        # Parse the CSV off the event loop
+        start = time.perf_counter()
+        df = await run_in_threadpool(read_csv_file, csv_path)
+        timings['parse'] = time.perf_counter() - start
+
+        # Initialize the data extractor with the dataframe, it persists the
+        # working dataset under ./users_data/{user_id}/. Chats of the previous
+        # session finish before its dataset is replaced.
+        async with user_lock(user_id):
+            start = time.perf_counter()
+            data_extractor = await run_in_threadpool(DataExtractor, df, user_id)
+            timings['dtype_inference'] = time.perf_counter() - start
+            del df
+
+            # May spill other sessions to disk, kept off the event loop
+            await run_in_threadpool(sessions.put, user_id, start_session(user_id, data_extractor))
+
+        return JSONResponse(content={
+            "message": "CSV uploaded and bot initialized successfully.",
+            "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+            "date_columns": data_extractor.date_report,
+            "memory": data_extractor.memory_report,
+        })
     
     except Exception as e:
         return JSONResponse(content={"error": str(e)})
 
+    finally:
+        # The spooled file is removed whether the parse worked or not
+        if csv_path is not None and os.path.exists(csv_path):
+            os.remove(csv_path)
+
+def chart_path_for(user_id: str, response_content: str):
+    # Path of the chart referenced by a "Figure: <name>" response, None for text responses
+    if not response_content.startswith("Figure:"):
+        return None
+    chart_name = response_content.split("Figure: ")[1].strip()
+    return os.path.join(chart_folder(user_id), chart_name)
+
+def chart_available(user_id: str, response_content: str):
+    chart_path = chart_path_for(user_id, response_content)
+    return chart_path is None or os.path.exists(chart_path)
+
+# Build the HTTP response for an agent answer
+def chat_response(user_id: str, response_content: str):
+    # Check if the response contains a chart (starts with "Figure:")
+    chart_path = chart_path_for(user_id, response_content)
+    if chart_path is not None:
+        if os.path.exists(chart_path):
+            touch(chart_path)
+            return FileResponse(chart_path, media_type="image/png")
+        else:
+            chart_name = os.path.basename(chart_path)
+            return JSONResponse(content={"error": f"Graph '{chart_name}' not found."}, status_code=404)
+
+    # If it's a regular text message
+    return JSONResponse(content={"response": response_content})
+
 # Chat endpoint to send the prompt and get a response
 @app.post("/chat/{user_id}")
 async def chat_with_model(user_id: str, request: PromptRequest):
+    async with user_lock(user_id):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(chat_executor, run_chat, user_id, request.prompt)
+
+# Blocking part of the chat endpoint, runs on chat_executor
+def run_chat(user_id: str, prompt: str, callbacks: list = None):
     try:
-        # Fetch the user's session, which includes the bot, thread_id, and conversation history
+        # Fetch the user's session, which includes the dataset and thread_id
         session = get_session(user_id)
-        bot = session.get('bot')
+        data_extractor = session.get('data_extractor')
         thread_id = session.get('thread_id')  # Retrieve the user-specific thread_id
-        messages = session.get('messages', [])  # Retrieve or initialize the message history
-        print(messages)
 
-        if not bot:
+        if not data_extractor:
             return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
         
         if not thread_id:
             return JSONResponse(content={"error": "Thread ID not found. Please reinitialize the bot."}, status_code=400)
 
-        # Get the prompt from the request body and add it to the message history
-        user_message = HumanMessage(content=request.prompt)
-        messages.append(user_message)
+        # Only the new message is sent, the checkpointer holds the previous ones
+        user_message = HumanMessage(content=prompt)
+
+        # Repeated prompts on unchanged data are answered from the cache
+        fingerprint = data_extractor.fingerprint()
+        cached_response = response_cache.get(user_id, prompt, fingerprint)
+        if cached_response is not None and chart_available(user_id, cached_response):
+            return chat_response(user_id, cached_response)
 
-        # Use the user-specific thread_id in the thread configuration
-        thread = {"configurable": {"thread_id": thread_id}}
+        # Use the user-specific thread_id and dataset in the thread configuration
+        thread = {"configurable": {"thread_id": thread_id, "data_extractor": data_extractor}, "callbacks": callbacks}
         
-        # Stream responses from the bot and capture the response message
-        response_message = None
-        for event in bot.graph.stream({"messages": messages}, thread):
-            for v in event.values():
-                if v:
-                    response_content = v["messages"][0].content
-
-                    # Check if the response contains a chart (starts with "Figure:")
-                    if response_content.startswith("Figure:"):
-                        chart_name = response_content.split("Figure: ")[1].strip()
-                        chart_path = os.path.join(f'./users_data/{user_id}/charts', chart_name)
-               
-                        if os.path.exists(chart_path):
-                            # Save bot's response as a message and update memory
-                            response_message = SystemMessage(content="Figure: " + chart_name)
-                            messages.append(response_message)
-                            session['messages'] = messages  # Save the updated history in session
-                            return FileResponse(chart_path, media_type="image/png")
-
-                        else:
-                            return JSONResponse(content={"error": f"Graph '{chart_name}' not found."}, status_code=404)
-
-                    # If it's a regular text message
-                    else:
-                        response_message = SystemMessage(content=response_content)
-                        messages.append(response_message)  # Update message history
-
-                        # Save the updated history in session
-                        session['messages'] = messages
-                        return JSONResponse(content={"response": response_content})
+        # Stream responses from the bot and capture the response message. The run goes
+        # to the end so the checkpoint with the answer is written to the history.
+        start = time.perf_counter()
+        answer = None
+        for event in agent.graph.stream({"messages": [user_message]}, thread):
+            for node, v in event.items():
+                if v and v.get("messages"):
+                    # The fast path reports the route of the tool it ran
+                    answer = (node, v.get('route', node), v["messages"][0].content)
+
+        if answer is None:
+            return None
+        node, route, response_content = answer
+        router_stats.record(node == 'fast_path', time.perf_counter() - start)
+        if route in CACHEABLE_ROUTES:
+            response_cache.put(user_id, prompt, fingerprint, response_content)
+
+        agent.end_turn(thread_id)
+        return chat_response(user_id, response_content)
 
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
     
+# Same as /chat, but the progress of the run is sent as Server-Sent Events while it
+# happens: node, route, tool_start/tool_end, answer tokens and a final done event
+@app.post("/chat-stream/{user_id}")
+async def chat_stream(user_id: str, request: PromptRequest):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    emit = lambda event: loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def events():
+        lock = user_lock(user_id)
+        await lock.acquire()
+        try:
+            future = loop.run_in_executor(chat_executor, run_chat, user_id, request.prompt, [StreamEventsHandler(emit)])
+        except BaseException:
+            lock.release()
+            raise
+        # The lock is held until the run finishes, even if the client disconnects first,
+        # so the next request of the user never runs alongside it. None marks the end
+        # of the run, queued after every event of the run.
+        future.add_done_callback(lambda _: (lock.release(), emit(None)))
+        while (event := await queue.get()) is not None:
+            yield sse_event(event)
+        yield sse_event(done_event(user_id, future.result()))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def done_event(user_id: str, response):
+    # Final event built from the response /chat would have returned
+    if response is None:
+        return {'event': 'done', 'status_code': 500, 'error': 'The agent did not return an answer.'}
+    if isinstance(response, FileResponse):
+        chart_name = os.path.basename(response.path)
+        return {'event': 'done', 'status_code': 200, 'chart': f"/charts/{user_id}/{chart_name}"}
+    return {'event': 'done', 'status_code': response.status_code, **json.loads(response.body)}
+
+@app.get("/charts/{user_id}/{chart_name}")
+async def get_chart(user_id: str, chart_name: str):
+    chart_path = os.path.join(chart_folder(user_id), os.path.basename(chart_name))
+    if not os.path.exists(chart_path):
+        return JSONResponse(content={"error": f"Graph '{chart_name}' not found."}, status_code=404)
+    return FileResponse(chart_path, media_type="image/png")
+
 @app.get("/download-charts/{user_id}")
 async def download_user_charts(user_id: str):
-    try:
-        # Generate the ZIP file for the user's charts
-        zip_filepath = create_user_chart_zip(user_id)
-        
-        # Return the ZIP file for download
-        return FileResponse(zip_filepath, media_type="application/zip", filename=f"{user_id}_charts.zip")
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="No charts found for the user")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating ZIP file: {e}")
+    # Downloads of the same user never update the archive at the same time
+    async with download_lock(user_id):
+        try:
+            charts = await run_in_threadpool(list_user_charts, user_id)
+            if not charts:
+                raise FileNotFoundError(user_id)
+
+            # Up to date archive, or one the new charts were appended to
+            zip_filepath = await run_in_threadpool(update_chart_zip, user_id, charts)
+            if zip_filepath is not None:
+                return FileResponse(zip_filepath, media_type="application/zip", filename=f"{user_id}_charts.zip")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="No charts found for the user")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error creating ZIP file: {e}")
+
+    # New archive, built on a worker thread into a file of its own and sent while it is
+    # written. At most a few chunks wait for a slow client; if the client leaves the
+    # build stops and the archive is built again by the next download. An error of
+    # the build is raised by the stream, the client gets a truncated archive.
+    return StreamingResponse(stream_from_thread(build_chart_zip, user_id, charts), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{user_id}_charts.zip"'})
 
 
 
 
 @app.get("/data-head-image/{user_id}")
 async def get_data_head_image(user_id: str):
-    # Fetch the user's session
-    session = get_session(user_id)
-    
-    # Get the Bot object from the session
-    bot = session.get('bot')
-    if not bot:
-        return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
-
-    # Get the first few rows of the DataFrame
-    data_head = bot.data_extractor.data.head()
+    async with user_lock(user_id):
+        # Get the user's dataset from the session
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
 
-    # Convert the DataFrame to an image and save it in the graphs folder
-    image_path = dataframe_to_image(data_head, f"data_head.png",user_id)
+        # Image of the first rows, drawn again only if the data changed since the last one
+        image_path = await run_in_threadpool(data_head_image, data_extractor, user_id)
 
     # Return the image as a FileResponse
     return FileResponse(image_path, media_type="image/png")
 
-@app.get("/download-csv/{user_id}")
-async def download_csv(user_id: str):
-    # Get the modified DataFrame from the user's session
-    session = get_session(user_id)
-    modified_df = session.get("bot").data_extractor.data
+# First rows of the dataset as JSON, for the frontend to render
+@app.get("/data-head/{user_id}")
+async def get_data_head(user_id: str, rows: int = 5):
+    async with user_lock(user_id):
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
+        head = await run_in_threadpool(data_head_json, data_extractor, max(0, min(rows, 100)))
+    return JSONResponse(content=head)
 
-    if modified_df is None:
-        return Response(content="CSV file not found.", status_code=404)
+# Export of the working dataset, streamed in chunks as it is written. format is one
+# of csv, csv.gz, csv.zst, parquet or arrow (Arrow IPC stream).
+@app.get("/download-csv/{user_id}")
+async def download_csv(user_id: str, format: str = 'csv'):
+    if format not in EXPORT_FORMATS:
+        return JSONResponse(content={"error": f"Unknown format '{format}', use one of: {', '.join(EXPORT_FORMATS)}."},
+                            status_code=400)
 
-    # Convert the DataFrame to CSV
-    csv_buffer = StringIO()
-    modified_df.to_csv(csv_buffer, index=False)
-    csv_content = csv_buffer.getvalue()
+    # Get the modified dataset from the user's session. The memory-mapped table keeps
+    # the data of this moment even if a later chat replaces the dataset file.
+    async with user_lock(user_id):
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return Response(content="CSV file not found.", status_code=404)
+        table = await run_in_threadpool(lambda: data_extractor.shared_dataset().read_table())
 
-    # Return the CSV as a downloadable file
+    extension, media_type, _ = EXPORT_FORMATS[format]
     headers = {
-        'Content-Disposition': f'attachment; filename="modified_data_{user_id}.csv"'
+        'Content-Disposition': f'attachment; filename="modified_data_{user_id}.{extension}"'
     }
-    return Response(content=csv_content, media_type="text/csv", headers=headers)
\ No newline at end of file
+    return StreamingResponse(stream_from_thread(export_table, table, format), media_type=media_type, headers=headers)
+
+# Run an undo/redo/restore on the user's dataset and report the resulting version
+async def change_version(user_id: str, change, error: str):
+    # Rebuilding a version reads the dataset, keep it off the event loop
+    async with user_lock(user_id):
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
+
+        changed = await run_in_threadpool(change, data_extractor)
+        if not changed:
+            return JSONResponse(content={"error": error}, status_code=400)
+
+        history = data_extractor.history.describe()
+        rows = data_extractor.row_count()
+    return JSONResponse(content={
+        "message": f"Dataset restored to version {history['current']}.",
+        "rows": rows,
+        "history": history,
+    })
+
+@app.post("/undo/{user_id}")
+async def undo(user_id: str):
+    return await change_version(user_id, lambda data_extractor: data_extractor.undo(), "Nothing to undo.")
+
+@app.post("/redo/{user_id}")
+async def redo(user_id: str):
+    return await change_version(user_id, lambda data_extractor: data_extractor.redo(), "Nothing to redo.")
+
+@app.post("/checkpoints/{user_id}")
+async def create_checkpoint(user_id: str, request: CheckpointRequest):
+    async with user_lock(user_id):
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
+        version = await run_in_threadpool(data_extractor.checkpoint, request.name)
+    return JSONResponse(content={"message": f"Checkpoint '{request.name}' saved at version {version}."})
+
+@app.post("/checkpoints/{user_id}/restore")
+async def restore_checkpoint(user_id: str, request: CheckpointRequest):
+    return await change_version(user_id, lambda data_extractor: data_extractor.restore_checkpoint(request.name),
+                                f"Checkpoint '{request.name}' not found.")
+
+@app.get("/history/{user_id}")
+async def get_history(user_id: str):
+    # Versions of the dataset with the memory each one holds
+    async with user_lock(user_id):
+        data_extractor = await session_data_extractor(user_id)
+        if not data_extractor:
+            return JSONResponse(content={"error": "Bot not initialized. Upload CSV first."}, status_code=400)
+        return JSONResponse(content=data_extractor.history.describe())
+
+@app.get("/stats")
+async def get_stats():
+    return JSONResponse(content={
+        "sessions": sessions.stats(),
+        "router": router_stats.stats(),
+        "llm": llm_stats.stats(),
+        "response_cache": response_cache.stats(),
+        "chart_cache": chart_cache_stats.stats(),
+    })
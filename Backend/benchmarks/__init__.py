@@ -0,0 +1,16 @@
+import atexit
+import os
+import shutil
+import tempfile
+import config
+
+
+def use_temp_data_folder():
+    # Benchmarks write their datasets to a temporary folder removed at exit, never to
+    # the repo's users_data. Also set in the environment for the worker processes of
+    # the compute pool.
+    folder = tempfile.mkdtemp(prefix='data_assistant_bench_')
+    config.USERS_DATA_FOLDER = folder
+    os.environ['USERS_DATA_FOLDER'] = folder
+    atexit.register(shutil.rmtree, folder, ignore_errors=True)
+    return folder
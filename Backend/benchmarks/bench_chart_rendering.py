@@ -0,0 +1,60 @@
+"""
+Render time of the line chart, scatter plot and bar chart as the rows grow. The data
+is reduced before plotting (min/max decimation, density raster, top-N categories), so the
+time should stay roughly flat apart from reading the columns.
+
+Run from the Backend folder:
+    python -m benchmarks.bench_chart_rendering --rows 4700 10001 100000 1000000 5000000
+
+Row counts that are not a multiple of the line chart buckets are included, the last
+bucket of the decimation is then partly empty.
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import charts
+from dataset_store import DatasetStore
+from benchmarks import use_temp_data_folder
+
+
+def build_dataset(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=rows)
+    df = pd.DataFrame({
+        'x': x,
+        'y': x * 0.5 + rng.normal(size=rows),
+        'walk': np.cumsum(rng.normal(size=rows)),
+        'label': pd.Categorical(rng.zipf(1.5, size=rows).clip(max=500).astype(str)),
+    })
+    dataset = DatasetStore('bench_chart_rendering')
+    dataset.save(df)
+    return dataset
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[4_700, 10_001, 100_000, 1_000_000, 5_000_000])
+    args = parser.parse_args()
+    use_temp_data_folder()
+
+    print(f"{'rows':>9} {'line (s)':>9} {'scatter (s)':>12} {'bar (s)':>8}")
+    for rows in args.rows:
+        dataset = build_dataset(rows)
+        fig_path = os.path.join(dataset.folder, 'chart.png')
+        line = timed(lambda: charts.line_chart(dataset, 'walk', 'blue', fig_path))
+        scatter = timed(lambda: charts.scatter_plot(dataset, 'x', 'y', 'red', fig_path))
+        bar = timed(lambda: charts.bar_chart(dataset, 'label', 'red', fig_path))
+        print(f"{rows:9d} {line:9.2f} {scatter:12.2f} {bar:8.2f}", flush=True)
+    dataset.delete()
+
+
+if __name__ == '__main__':
+    main()
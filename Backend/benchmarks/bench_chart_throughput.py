@@ -0,0 +1,79 @@
+"""
+Charts rendered per second by concurrent sessions, with the 'thread' and 'process'
+compute backends, and with the figure pool against a new figure for every chart.
+Every session renders a histogram, a bar chart, a line chart and a scatter plot.
+
+Run from the Backend folder:
+    python -m benchmarks.bench_chart_throughput --sessions 1 4 8 --rows 100000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import charts
+from compute_pool import ComputePool
+from dataset_store import DatasetStore
+from benchmarks import use_temp_data_folder
+
+CHARTS_PER_ROUND = 4
+
+
+def build_dataset(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=rows)
+    df = pd.DataFrame({
+        'x': x,
+        'y': x * 0.5 + rng.normal(size=rows),
+        'label': pd.Categorical(rng.choice(list('abcdefgh'), size=rows)),
+    })
+    dataset = DatasetStore('bench_chart_throughput')
+    dataset.save(df)
+    return dataset
+
+
+def session_charts(pool, dataset, session, rounds):
+    fig_path = os.path.join(dataset.folder, f'chart_{session}.png')
+    for _ in range(rounds):
+        pool.run(charts.histogram, dataset, 'x', 'blue', True, fig_path)
+        pool.run(charts.bar_chart, dataset, 'label', 'red', fig_path)
+        pool.run(charts.line_chart, dataset, 'y', 'blue', fig_path)
+        pool.run(charts.scatter_plot, dataset, 'x', 'y', 'red', fig_path)
+
+
+def charts_per_second(pool, dataset, sessions, rounds):
+    # Warm up: worker processes started, figures in the pool
+    session_charts(pool, dataset, 'warmup', 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(lambda session: session_charts(pool, dataset, session, rounds), range(sessions)))
+    return sessions * rounds * CHARTS_PER_ROUND / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, os.cpu_count() or 1])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=5, help='rounds of charts per session')
+    args = parser.parse_args()
+    use_temp_data_folder()
+
+    dataset = build_dataset(args.rows)
+    thread_pool = ComputePool('thread')
+    process_pool = ComputePool('process')
+    pool_size = charts.figure_pool.max_idle
+
+    print(f"{'sessions':>8} {'thread, new figures':>20} {'thread, pooled':>15} {'process, pooled':>16}  (charts/s)")
+    for sessions in args.sessions:
+        charts.figure_pool.max_idle = 0
+        fresh = charts_per_second(thread_pool, dataset, sessions, args.rounds)
+        charts.figure_pool.max_idle = pool_size
+        pooled = charts_per_second(thread_pool, dataset, sessions, args.rounds)
+        processes = charts_per_second(process_pool, dataset, sessions, args.rounds)
+        print(f"{sessions:8d} {fresh:20.1f} {pooled:15.1f} {processes:16.1f}", flush=True)
+    dataset.delete()
+
+
+if __name__ == '__main__':
+    main()
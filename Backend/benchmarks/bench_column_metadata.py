@@ -0,0 +1,66 @@
+"""
+Cost of keeping the column info (dtype, NA count) up to date after a cheap edit:
+full rescan with get_column_values_info versus the incremental updates.
+
+The default 200 columns x 5M rows float table takes about 8 GB, use --rows
+for a smaller run. Run from the Backend folder:
+    python -m benchmarks.bench_column_metadata --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from data_extractor import DataExtractor
+
+
+def build_frame(rows, cols, na_cols, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((rows, cols)), columns=[f'col_{i}' for i in range(cols)])
+    for i in range(na_cols):
+        df.loc[rng.random(rows) < 0.1, f'col_{i}'] = np.nan
+    return df
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--cols', type=int, default=200)
+    parser.add_argument('--na-cols', type=int, default=20, help='columns with missing values')
+    args = parser.parse_args()
+
+    df = build_frame(args.rows, args.cols, args.na_cols)
+
+    # Only the metadata methods are measured, the dataset is never persisted
+    extractor = DataExtractor.__new__(DataExtractor)
+    extractor._data = df
+    extractor._pending_mask = None
+    extractor.columns = extractor.get_column_values_info(df)
+
+    # Row filter: rescan of the filtered frame versus counting through the mask
+    mask = (df['col_0'] > 0.5).to_numpy()
+    filtered = df[mask]
+    full_filter, expected = timed(lambda: extractor.get_column_values_info(filtered))
+    incremental_filter, derived = timed(lambda: extractor.filtered_column_values_info(df, mask))
+    assert all(expected[col]['na_count'] == derived[col]['na_count'] for col in expected)
+
+    # Imputation of one column: full rescan versus recomputing that column
+    df['col_1'] = df['col_1'].fillna(0.0)
+    full_impute, _ = timed(lambda: extractor.get_column_values_info(df))
+    incremental_impute, _ = timed(lambda: extractor.update_column_values_info(['col_1']))
+
+    print()
+    print(f"{args.cols} columns x {args.rows} rows, {args.na_cols} columns with missing values")
+    print(f"{'edit':12} {'full (s)':>9} {'incremental (s)':>16} {'speedup':>8}")
+    for edit, full, incremental in (('filter', full_filter, incremental_filter),
+                                    ('imputation', full_impute, incremental_impute)):
+        print(f"{edit:12} {full:9.3f} {incremental:16.3f} {full / incremental:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Throughput of the CPU-heavy tool jobs (KNN imputation, correlation, histogram) run
+from concurrent sessions, with the 'thread' and 'process' compute backends.
+
+Run from the Backend folder:
+    python -m benchmarks.bench_compute_pool --sessions 8 --rows 20000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import charts
+from compute_pool import ComputePool, knn_impute, correlations_with
+from dataset_store import DatasetStore
+from benchmarks import use_temp_data_folder
+
+
+def build_dataset(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((rows, 10)), columns=[f'col_{i}' for i in range(10)])
+    df.loc[rng.random(rows) < 0.1, 'col_0'] = np.nan
+    dataset = DatasetStore('bench_compute_pool')
+    dataset.save(df)
+    return dataset
+
+
+def session_jobs(pool, dataset, session):
+    fig_path = os.path.join(dataset.folder, f'hist_{session}.png')
+    pool.run(knn_impute, dataset, ['col_0', 'col_1', 'col_2'], 5)
+    pool.run(correlations_with, dataset, 'col_1')
+    pool.run(charts.histogram, dataset, 'col_1', 'blue', True, fig_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=os.cpu_count() or 1, help='concurrent sessions')
+    parser.add_argument('--rows', type=int, default=20_000)
+    args = parser.parse_args()
+    use_temp_data_folder()
+
+    dataset = build_dataset(args.rows)
+    results = {}
+    for backend in ('thread', 'process'):
+        pool = ComputePool(backend=backend, workers=args.sessions)
+        # Warm up the worker processes so their start-up is not measured
+        with ThreadPoolExecutor(args.sessions) as threads:
+            list(threads.map(lambda _: pool.run(correlations_with, dataset, 'col_1'), range(args.sessions)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.sessions) as threads:
+            list(threads.map(lambda session: session_jobs(pool, dataset, session), range(args.sessions)))
+        results[backend] = time.perf_counter() - start
+
+    print(f"{args.sessions} concurrent sessions, {args.rows} rows, {os.cpu_count()} cores")
+    print(f"{'backend':8} {'seconds':>8} {'sessions/s':>11}")
+    for backend, seconds in results.items():
+        print(f"{backend:8} {seconds:8.2f} {args.sessions / seconds:11.2f}")
+    dataset.delete()
+
+
+if __name__ == '__main__':
+    main()
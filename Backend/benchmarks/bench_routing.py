@@ -0,0 +1,125 @@
+"""
+Compare the two routing modes of the agent on a fixed, labelled prompt set.
+
+Needs a running Ollama server. Run from the Backend folder:
+    OLLAMA_BASE_URL=http://localhost:11434 python -m benchmarks.bench_routing
+"""
+import argparse
+import statistics
+import time
+from uuid import uuid4
+from langchain_core.messages import HumanMessage
+from langchain_ollama import ChatOllama
+from langgraph.checkpoint.memory import MemorySaver
+from data_extractor import DataExtractor
+from new_agent_llm import Agent
+from utils import read_csv_file
+import config
+from benchmarks import use_temp_data_folder
+
+CSV_FILE = '../csv_files/student.csv'
+
+# (prompt, expected route, expected column for modifications)
+PROMPTS = [
+    ("Filter the rows where mark is greater than 60", 'data_modification', 'mark'),
+    ("Keep only the students whose class is Four", 'data_modification', 'class'),
+    ("Drop the column id", 'data_modification', 'id'),
+    ("Remove every row where gender equals male", 'data_modification', 'gender'),
+    ("Fill the missing values of mark with the median", 'process_na_values', None),
+    ("Impute the NA values in class with the most frequent value", 'process_na_values', None),
+    ("Use KNN imputation on mark", 'process_na_values', None),
+    ("Give me the descriptive statistics of mark", 'create_analysis', None),
+    ("Which columns are most correlated with mark?", 'create_analysis', None),
+    ("How many students are there per class?", 'create_analysis', None),
+    ("Detect outliers in mark", 'create_analysis', None),
+    ("Show a histogram of mark", 'create_graphics', None),
+    ("Make a bar chart of gender", 'create_graphics', None),
+    ("Plot mark as a line chart", 'create_graphics', None),
+    ("What can you do?", 'help_user', None),
+    ("How do I use this application?", 'help_user', None),
+    ("What's the weather like in Madrid?", 'prompt_unrelated', None),
+    ("Write me a poem about cats", 'prompt_unrelated', None),
+]
+
+
+LEAF_NODES = ('data_modification', 'process_na_values', 'create_analysis',
+              'create_graphics', 'help_user', 'prompt_unrelated')
+
+
+def build_agent(model, routing_mode):
+    tool_schemas = DataExtractor.tool_schemas()
+    return Agent(
+        model=model,
+        business_description="benchmark",
+        data_modifications_tools=tool_schemas.data_modifications_tools,
+        process_na_value_tools=tool_schemas.process_na_values_tools,
+        data_analysis_tools=tool_schemas.data_analysis_tools,
+        data_graphics_tools=tool_schemas.data_graphics_tools,
+        checkpointer=MemorySaver(),
+        routing_mode=routing_mode,
+        # Measure the LLM routers themselves
+        fast_path=False,
+    )
+
+
+def run_mode(agent, df):
+    latencies, route_hits, column_hits, column_total = [], 0, 0, 0
+    for prompt, expected_route, expected_column in PROMPTS:
+        # Fresh dataset per prompt, modifications must not leak into the next one
+        data_extractor = DataExtractor(df.copy(), 'bench_routing')
+        thread = {"configurable": {"thread_id": str(uuid4()), "data_extractor": data_extractor}}
+
+        route, column = None, None
+        start = time.perf_counter()
+        try:
+            # Debug events announce each task before it runs, so the route is known
+            # even if the tool call of the leaf node fails
+            for event in agent.graph.stream({"messages": [HumanMessage(content=prompt)]}, thread, stream_mode='debug'):
+                payload = event['payload']
+                if event['type'] == 'task' and payload['name'] in LEAF_NODES:
+                    route = payload['name']
+                elif event['type'] == 'task_result' and payload['name'] == 'start_node':
+                    column = dict(payload['result']).get('column')
+        except Exception as e:
+            print(f"  error on '{prompt}': {e}")
+        latencies.append(time.perf_counter() - start)
+
+        route_hits += route == expected_route
+        if expected_column:
+            column_total += 1
+            column_hits += column == expected_column
+        print(f"  {latencies[-1]:6.2f}s  {str(route):18} expected {expected_route:18} {prompt}")
+
+    return {
+        'p50': statistics.median(latencies),
+        'mean': statistics.mean(latencies),
+        'max': max(latencies),
+        'route_accuracy': route_hits / len(PROMPTS),
+        'column_accuracy': column_hits / column_total if column_total else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['cascade', 'structured'])
+    args = parser.parse_args()
+    use_temp_data_folder()
+
+    df = read_csv_file(CSV_FILE)
+    model = ChatOllama(model=config.OLLAMA_MODEL, base_url=config.OLLAMA_BASE_URL, temperature=0)
+
+    results = {}
+    for mode in args.modes:
+        print(f"Routing mode: {mode}")
+        results[mode] = run_mode(build_agent(model, mode), df)
+
+    print()
+    print(f"{'mode':12} {'p50 (s)':>8} {'mean (s)':>9} {'max (s)':>8} {'route acc':>10} {'column acc':>11}")
+    for mode, r in results.items():
+        # Only the structured router exposes the column it picked
+        column_accuracy = f"{r['column_accuracy']:.0%}" if mode == 'structured' else '-'
+        print(f"{mode:12} {r['p50']:8.2f} {r['mean']:9.2f} {r['max']:8.2f} {r['route_accuracy']:10.0%} {column_accuracy:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Load test of the chat endpoint: concurrent users, each uploading a dataset and then
+sending a sequence of prompts, with the p50/p99 latency of the chat requests.
+
+Needs the API running (and Ollama behind it for the prompts the fast path does not
+answer). Run from the Backend folder:
+    python -m benchmarks.load_test_chat --url http://localhost:8000 --users 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+import httpx
+
+CSV_FILE = '../csv_files/student.csv'
+
+# Mix of prompts answered by the fast path, analysis, charts and modifications
+PROMPTS = [
+    "Give me the descriptive statistics of mark",
+    "histogram of mark",
+    "What can you do?",
+    "Filter the rows where mark is greater than 60",
+    "Detect outliers in mark",
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def run_user(client, csv_content, rounds, latencies, errors):
+    user_id = f"load_{uuid4().hex[:8]}"
+    response = await client.post(f"/upload-csv/{user_id}", files={'file': ('data.csv', csv_content)})
+    if 'error' in response.json():
+        errors.append(response.json()['error'])
+        return
+
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            start = time.perf_counter()
+            response = await client.post(f"/chat/{user_id}", json={'prompt': prompt})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.text)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=1, help='times each user sends the prompt set')
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    with open(CSV_FILE, 'rb') as f:
+        csv_content = f.read()
+
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_user(client, csv_content, args.rounds, latencies, errors) for _ in range(args.users)))
+        elapsed = time.perf_counter() - start
+
+        stats = (await client.get('/stats')).json()
+
+    print(f"{args.users} users, {len(latencies)} chat requests in {elapsed:.1f}s ({len(latencies) / elapsed:.2f} req/s)")
+    if latencies:
+        print(f"p50 {percentile(latencies, 50):.2f}s  p99 {percentile(latencies, 99):.2f}s  "
+              f"mean {statistics.mean(latencies):.2f}s  max {max(latencies):.2f}s")
+    print(f"errors: {len(errors)}")
+    for error in errors[:5]:
+        print(f"  {error[:200]}")
+    print(f"router: {stats['router']}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import re
+import threading
+import config
+
+
+def chart_folder(user_id):
+    return os.path.join(config.USERS_DATA_FOLDER, user_id, 'charts')
+
+
+class ChartCacheStats:
+    # Hits, misses and evictions of the chart caches of every user, a session evicted
+    # from memory does not take its counts with it
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def record(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'hit_rate': self.counters['hits'] / lookups if lookups else 0.0,
+            }
+
+
+chart_cache_stats = ChartCacheStats()
+
+
+class ChartCache:
+    """
+    Content-addressed store of a user's rendered charts in ./users_data/{user_id}/charts.
+
+    A chart file is named after a hash of (chart type, columns, style arguments, data
+    fingerprint), so the same chart of the same data always maps to the same file and
+    is only rendered once, while a chart of modified data never overwrites an older
+    one. The folder is capped at max_bytes / max_files, the least recently used charts
+    (by file modification time, refreshed on every hit) are evicted first.
+    """
+
+    def __init__(self, user_id, max_bytes=config.CHART_CACHE_MAX_BYTES, max_files=config.CHART_CACHE_MAX_FILES):
+        self.folder = chart_folder(user_id)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def chart_name(chart_type, columns, style, fingerprint):
+        digest = hashlib.sha1(repr((chart_type, list(columns), list(style), fingerprint)).encode()).hexdigest()
+        # Readable prefix, the hash makes the name unique
+        label = re.sub(r'[^\w.-]', '_', '_vs_'.join(columns))
+        return f"{chart_type}_{label}_{digest[:12]}.png"
+
+    def get_or_render(self, chart_type, columns, style, fingerprint, render):
+        # Name of the chart, render(fig_path) is only called if it is not on disk yet
+        chart_name = self.chart_name(chart_type, columns, style, fingerprint)
+        chart_path = os.path.join(self.folder, chart_name)
+        with self.lock:
+            if os.path.exists(chart_path):
+                chart_cache_stats.record('hits')
+                touch(chart_path)
+                return chart_name
+            chart_cache_stats.record('misses')
+
+            os.makedirs(self.folder, exist_ok=True)
+            # Rendered aside and swapped in, a reader never gets a partial PNG
+            tmp_path = chart_path + '.tmp.png'
+            render(tmp_path)
+            os.replace(tmp_path, chart_path)
+            self._evict(keep=chart_path)
+        return chart_name
+
+    def _evict(self, keep):
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith('.png') and not entry.name.endswith('.tmp.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes and len(entries) <= self.max_files:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total_bytes -= size
+            entries = [entry for entry in entries if entry[2] != path]
+            chart_cache_stats.record('evictions')
+
+
+def touch(chart_path):
+    # A chart served from disk becomes the most recently used one
+    try:
+        os.utime(chart_path)
+    except OSError:
+        pass
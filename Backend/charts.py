@@ -0,0 +1,186 @@
+import queue
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import matplotlib
+# Headless rendering, whatever the environment of the API process or worker
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LinearSegmentedColormap, LogNorm
+from matplotlib.figure import Figure
+import config
+
+# Chart renderers run by the compute pool. They read only the columns they plot from
+# the user's DatasetStore and save the figure to fig_path. Figures are drawn on their
+# own Agg canvas through the object-oriented API, never through pyplot, whose global
+# state is not thread-safe, so renders can run in parallel threads or processes.
+#
+# The data is reduced before it reaches matplotlib, so the render time does not
+# grow with the rows: line charts keep the min and max of CHART_LINE_BUCKETS
+# buckets, scatter plots of more than CHART_SCATTER_MAX_POINTS rows are drawn as a
+# density raster and bar charts show the CHART_MAX_CATEGORIES most frequent values.
+
+
+class FigurePool:
+    """
+    Figures with their Agg canvas, reused across renders instead of being built for
+    every chart. Each render takes a figure of its own, so parallel renders never share
+    one, and the figure is cleared and its layout reset when it is given back.
+    """
+
+    def __init__(self, max_idle=config.CHART_FIGURE_POOL_SIZE):
+        self.idle = queue.LifoQueue()
+        self.max_idle = max_idle
+
+    @contextmanager
+    def figure(self):
+        try:
+            fig = self.idle.get_nowait()
+        except queue.Empty:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            # tight_layout changes the margins of the figure, not of its axes
+            fig.subplotpars.update(**{
+                name: matplotlib.rcParams[f'figure.subplot.{name}']
+                for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+            })
+            if self.idle.qsize() < self.max_idle:
+                self.idle.put(fig)
+
+
+# One pool per process, the worker processes of the compute pool get their own
+figure_pool = FigurePool()
+
+
+def value_counts(values, max_categories=config.CHART_MAX_CATEGORIES):
+    # Categories left without rows by a filter get no bar, the least frequent ones
+    # beyond max_categories are summed in a single 'Other' bar
+    counts = values.value_counts()
+    counts = counts[counts > 0]
+    if len(counts) > max_categories:
+        other = pd.Series([counts.iloc[max_categories:].sum()], index=[f'Other ({len(counts) - max_categories})'])
+        counts = pd.concat([counts.iloc[:max_categories].rename(index=str), other])
+    return counts
+
+
+def as_float(values):
+    # Nullable and downcast numeric columns as a plain float array, NA as NaN
+    return pd.Series(values).to_numpy(dtype='float64', na_value=np.nan)
+
+
+def minmax_decimate(x, y, buckets):
+    # Splits the points in buckets of consecutive rows and keeps the min and max of
+    # each one, in x order. Peaks and dips stay visible, unlike with a plain stride.
+    if len(y) <= 2 * buckets:
+        return x, y
+    size = -(-len(y) // buckets)
+    # Only as many buckets as it takes to cover the rows, so every bucket holds rows.
+    # The last one is padded, NaN (padding or missing values) never wins the min or
+    # max; a bucket of missing values only keeps its first row, a gap in the line.
+    buckets = -(-len(y) // size)
+    missing = np.isnan(y)
+    lows = np.full(buckets * size, np.inf)
+    lows[:len(y)] = np.where(missing, np.inf, y)
+    highs = np.full(buckets * size, -np.inf)
+    highs[:len(y)] = np.where(missing, -np.inf, y)
+    offsets = np.arange(buckets) * size
+    keep = np.unique(np.concatenate([
+        offsets + lows.reshape(buckets, size).argmin(axis=1),
+        offsets + highs.reshape(buckets, size).argmax(axis=1),
+    ]))
+    return x[keep], y[keep]
+
+
+def density_grid(x, y, bins):
+    # Rows per cell of a bins x bins grid over the data range, counted in one
+    # bincount pass (faster than np.histogram2d or hexbin on millions of points)
+    x_min, x_max, y_min, y_max = x.min(), x.max(), y.min(), y.max()
+    x_cell = ((x - x_min) * (bins / (x_max - x_min or 1))).astype(np.int64).clip(max=bins - 1)
+    y_cell = ((y - y_min) * (bins / (y_max - y_min or 1))).astype(np.int64).clip(max=bins - 1)
+    counts = np.bincount(y_cell * bins + x_cell, minlength=bins * bins).reshape(bins, bins)
+    return counts, (x_min, x_max, y_min, y_max)
+
+
+def draw_bars(ax, counts, color, alpha=1.0):
+    positions = np.arange(len(counts))
+    ax.bar(positions, counts.to_numpy(), color=color, alpha=alpha)
+    ax.set_xticks(positions, [str(label) for label in counts.index], rotation=90)
+
+
+def bar_chart(dataset, column_name, color, fig_path):
+    values = dataset.load([column_name])[column_name]
+
+    with figure_pool.figure() as fig:
+        ax = fig.subplots()
+        draw_bars(ax, value_counts(values), color)
+        ax.set_title(f"Bar Chart: {column_name}")
+        ax.set_xlabel(column_name)
+        ax.set_ylabel("Count")
+        # Room for the rotated labels
+        fig.tight_layout()
+        fig.savefig(fig_path)
+
+
+def histogram(dataset, column_name, color, numeric, fig_path):
+    values = dataset.load([column_name])[column_name]
+
+    with figure_pool.figure() as fig:
+        ax = fig.subplots()
+        if numeric:
+            # For numeric columns, create a histogram. The bins are counted by numpy.
+            finite = as_float(values)
+            finite = finite[np.isfinite(finite)]
+            counts, edges = np.histogram(finite, bins=10)
+            ax.stairs(counts, edges, fill=True, color=color, alpha=0.7)
+            ax.set_title(f"Histogram: {column_name}")
+            ax.set_xlabel("Value")
+            ax.set_ylabel("Frequency")
+        else:
+            # For categorical columns, create a bar chart
+            draw_bars(ax, value_counts(values), color, alpha=0.7)
+            ax.set_title(f"Bar Chart: {column_name}")
+            ax.set_xlabel(column_name)
+            ax.set_ylabel("Count")
+        # Room for the rotated labels
+        fig.tight_layout()
+        fig.savefig(fig_path)
+
+
+def line_chart(dataset, column_name, color, fig_path, buckets=config.CHART_LINE_BUCKETS):
+    values = dataset.load([column_name])[column_name].dropna()
+    x, y = minmax_decimate(values.index.to_numpy(), as_float(values), buckets)
+
+    with figure_pool.figure() as fig:
+        ax = fig.subplots()
+        ax.plot(x, y, color=color)
+        ax.set_title(f"Line Chart: {column_name}")
+        ax.set_xlabel("Index")
+        ax.set_ylabel(column_name)
+        fig.savefig(fig_path)
+
+
+def scatter_plot(dataset, x_column, y_column, color, fig_path, max_points=config.CHART_SCATTER_MAX_POINTS):
+    frame = dataset.load([x_column, y_column])
+    x, y = as_float(frame[x_column]), as_float(frame[y_column])
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+
+    with figure_pool.figure() as fig:
+        ax = fig.subplots()
+        if len(x) <= max_points:
+            ax.scatter(x, y, color=color)
+        else:
+            # Too many points to tell apart: cells shaded by their number of rows
+            counts, extent = density_grid(x, y, config.CHART_DENSITY_BINS)
+            cmap = LinearSegmentedColormap.from_list('density', ['white', color])
+            image = ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=extent, aspect='auto',
+                              cmap=cmap, norm=LogNorm(), interpolation='nearest')
+            fig.colorbar(image, ax=ax, label="Rows")
+        ax.set_title(f"Scatter Plot: {x_column} vs {y_column}")
+        ax.set_xlabel(x_column)
+        ax.set_ylabel(y_column)
+        fig.savefig(fig_path)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import config
+
+# Nullable integer types tried from the smallest. Vectorized pandas reductions upcast
+# them, but scalars taken from an Int8/Int16 column keep its width and overflow in
+# arithmetic: tools doing scalar arithmetic convert the column to float64 first.
+INTEGER_TYPES = ['Int8', 'Int16', 'Int32']
+
+
+def compact_column(series, category_max_ratio):
+    # Smallest dtype holding the same values, the series unchanged if none is smaller
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    if pd.api.types.is_integer_dtype(series):
+        if series.isna().all():
+            return series.astype('Int8')
+        low, high = series.min(), series.max()
+        for integer_type in INTEGER_TYPES:
+            info = np.iinfo(integer_type.lower())
+            if info.min <= low and high <= info.max:
+                return series.astype(integer_type)
+        return series
+
+    if pd.api.types.is_float_dtype(series):
+        # Only when float32 represents every value exactly
+        compact = series.astype('Float32')
+        if compact.astype('Float64').eq(series.astype('Float64')).fillna(True).all():
+            return compact
+        return series
+
+    # Object columns of mixed types are left as they are
+    if pd.api.types.is_string_dtype(series):
+        values = series.dropna()
+        if len(values) and values.nunique() <= category_max_ratio * len(values):
+            # Repeated labels are stored once, the rows only keep small integer codes
+            return series.astype(object).astype('category')
+        return series.astype('string[pyarrow]')
+
+    return series
+
+
+def compact_dtypes(df, category_max_ratio=config.CATEGORY_MAX_RATIO):
+    """
+    Converts every column to its most memory efficient dtype: text columns with few
+    distinct values (at most category_max_ratio of their non-missing values) become
+    categoricals and the other ones Arrow-backed strings, integers are downcast to the
+    smallest nullable integer type holding their range and floats to float32 when no
+    value loses precision.
+    """
+    return pd.DataFrame({col: compact_column(df[col], category_max_ratio) for col in df.columns}, index=df.index)
+
+
+def memory_report(before, after):
+    # Bytes of every column before/after, before being memory_usage(deep=True) of the
+    # frame as parsed from the CSV
+    columns = {
+        col: {
+            'dtype': str(after[col].dtype),
+            'bytes_before': int(before[col]),
+            'bytes_after': int(after_bytes),
+        }
+        for col, after_bytes in after.memory_usage(deep=True, index=False).items()
+    }
+    return {
+        'bytes_before': sum(info['bytes_before'] for info in columns.values()),
+        'bytes_after': sum(info['bytes_after'] for info in columns.values()),
+        'columns': columns,
+    }
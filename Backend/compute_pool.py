@@ -0,0 +1,70 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import config
+import imputation
+
+
+class ComputePool:
+    """
+    Runs the CPU-heavy tool jobs (KNN imputation, correlation, charts).
+
+    With the 'process' backend the jobs run on a pool of worker processes, so they
+    do not hold the GIL of the API process and scale with the cores. Jobs receive
+    the user's DatasetStore instead of a DataFrame: only the file path is pickled
+    and the worker reads the columns it needs from the memory-mapped Arrow file.
+    The 'thread' backend runs them in the calling thread.
+    """
+
+    def __init__(self, backend=config.COMPUTE_BACKEND, workers=config.COMPUTE_WORKERS):
+        self.backend = backend
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def run(self, job, *args):
+        if self.backend != 'process':
+            return job(*args)
+        return self._get_executor().submit(job, *args).result()
+
+    def _get_executor(self):
+        # Started on first use, spawned workers do not inherit the API threads
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self.executor
+
+
+compute_pool = ComputePool()
+
+
+###################### JOBS #########################
+# Module-level functions so the worker processes can import them
+
+def knn_impute(dataset, columns, n_neighbors, group_column=None, time_column=None, time_window=None):
+    group_columns = [group_column] if group_column else []
+    time_columns = [time_column] if time_column and time_window else []
+    frame = dataset.load(list(dict.fromkeys(columns + group_columns + time_columns)))
+    return imputation.knn_impute(frame, columns, n_neighbors, group_columns, time_column, time_window)
+
+
+def correlations_with(dataset, column_name):
+    # Absolute correlations of the numeric columns with column_name, sorted, likely
+    # index columns ('id', 'index') excluded. None if column_name is not one of them.
+    schema = dataset.read_table().schema
+    numeric_columns = [
+        field.name for field in schema
+        if (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))
+        and 'id' not in field.name.lower() and 'index' not in field.name.lower()
+    ]
+    if column_name not in numeric_columns:
+        return None
+
+    # Only the correlations with the requested column are needed, not the full matrix
+    numeric_data = dataset.load(numeric_columns)[numeric_columns]
+    correlations = numeric_data.corrwith(numeric_data[column_name])
+    return correlations.abs().sort_values(ascending=False)
@@ -0,0 +1,82 @@
+import os
+
+# Base folder where every user's files (uploads, datasets, charts) are stored
+USERS_DATA_FOLDER = os.environ.get('USERS_DATA_FOLDER', './users_data')
+
+# CSV ingestion
+# 'pyarrow' parses the spooled file with the streaming Arrow reader in blocks of
+# CSV_BLOCK_BYTES, 'chunked' uses pandas read_csv in chunks of CSV_CHUNK_ROWS rows
+CSV_INGESTION_MODE = os.environ.get('CSV_INGESTION_MODE', 'pyarrow')
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))  # bytes read per await
+CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', 200_000))
+CSV_BLOCK_BYTES = int(os.environ.get('CSV_BLOCK_BYTES', 16 * 1024 * 1024))  # bytes parsed per pyarrow batch
+
+# Date detection on upload: the format of a text column is inferred on a sample of
+# DATE_SAMPLE_ROWS rows and kept if it parses at least DATE_MIN_PARSED_RATIO of them
+DATE_SAMPLE_ROWS = int(os.environ.get('DATE_SAMPLE_ROWS', 1000))
+DATE_MIN_PARSED_RATIO = float(os.environ.get('DATE_MIN_PARSED_RATIO', 0.8))
+
+# Columns are stored with their most compact dtype (categoricals, downcast numerics,
+# Arrow strings). Text columns become categoricals when their distinct values are at
+# most CATEGORY_MAX_RATIO of their values.
+COMPACT_DTYPES = os.environ.get('COMPACT_DTYPES', 'true').lower() == 'true'
+CATEGORY_MAX_RATIO = float(os.environ.get('CATEGORY_MAX_RATIO', 0.5))
+
+# Session management
+SESSION_MEMORY_BUDGET = int(os.environ.get('SESSION_MEMORY_BUDGET', 2 * 1024 ** 3))  # bytes for all in-memory datasets
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 60 * 60))  # seconds a session may stay idle in memory
+
+# LLM
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://ollama:11434')
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'llama3.1:latest')
+# Time the model stays loaded after a request, a reloaded model loses its prompt cache
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+# Columns listed at most in the dataset context of a prompt
+PROMPT_MAX_COLUMNS = int(os.environ.get('PROMPT_MAX_COLUMNS', 50))
+
+# Conversation history: checkpoints of the agent threads are stored in CHECKPOINT_DB,
+# the last CHECKPOINTS_PER_THREAD of each thread are kept and the agent state holds
+# at most MAX_HISTORY_MESSAGES messages
+CHECKPOINT_DB = os.environ.get('CHECKPOINT_DB', os.path.join(USERS_DATA_FOLDER, 'checkpoints.sqlite'))
+CHECKPOINTS_PER_THREAD = int(os.environ.get('CHECKPOINTS_PER_THREAD', 4))
+MAX_HISTORY_MESSAGES = int(os.environ.get('MAX_HISTORY_MESSAGES', 20))
+
+# LLM routing
+# 'cascade' classifies with two sequential LLM calls (high level, then data task),
+# 'structured' resolves the route and target column in a single JSON call
+ROUTING_MODE = os.environ.get('ROUTING_MODE', 'cascade')
+# Deterministic keyword/column router tried before any LLM call
+FAST_PATH_ROUTER = os.environ.get('FAST_PATH_ROUTER', 'true').lower() == 'true'
+
+# Caches
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))  # chat answers kept across all users
+
+# Data modification
+# Filters only combine a row mask, the rows are selected once when the data is needed
+LAZY_FILTERS = os.environ.get('LAZY_FILTERS', 'true').lower() == 'true'
+
+# Concurrency
+CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', 8))  # agent runs executed at the same time
+# CPU-heavy tools (KNN imputation, correlation, charts): 'process' runs them on a pool
+# of COMPUTE_WORKERS processes, 'thread' in the agent run's own thread
+COMPUTE_BACKEND = os.environ.get('COMPUTE_BACKEND', 'process')
+COMPUTE_WORKERS = int(os.environ.get('COMPUTE_WORKERS', os.cpu_count() or 1))
+
+# Charts: the data is reduced before plotting so rendering does not grow with the rows
+CHART_LINE_BUCKETS = int(os.environ.get('CHART_LINE_BUCKETS', 1000))  # line charts keep the min/max of each bucket
+CHART_SCATTER_MAX_POINTS = int(os.environ.get('CHART_SCATTER_MAX_POINTS', 20_000))  # density raster above this
+CHART_DENSITY_BINS = int(os.environ.get('CHART_DENSITY_BINS', 200))  # cells per axis of the raster
+CHART_MAX_CATEGORIES = int(os.environ.get('CHART_MAX_CATEGORIES', 30))  # bars, the rest summed as 'Other'
+CHART_FIGURE_POOL_SIZE = int(os.environ.get('CHART_FIGURE_POOL_SIZE', 8))  # idle figures kept for reuse per process
+# Rendered charts are cached per user, least recently used ones evicted beyond these
+CHART_CACHE_MAX_BYTES = int(os.environ.get('CHART_CACHE_MAX_BYTES', 200 * 1024 ** 2))
+CHART_CACHE_MAX_FILES = int(os.environ.get('CHART_CACHE_MAX_FILES', 500))
+
+# Dataset export: rows converted per batch and bytes sent per chunk
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', 100_000))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', 1024 * 1024))
+
+# KNN imputation
+KNN_EXACT_MAX_ROWS = int(os.environ.get('KNN_EXACT_MAX_ROWS', 20_000))  # sklearn's exact KNNImputer up to this size
+KNN_MAX_DONORS = int(os.environ.get('KNN_MAX_DONORS', 200_000))  # donor rows sampled per imputed column
+KNN_CHUNK_ROWS = int(os.environ.get('KNN_CHUNK_ROWS', 50_000))  # rows to impute per neighbour query
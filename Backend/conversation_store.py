@@ -0,0 +1,41 @@
+import os
+import sqlite3
+from langgraph.checkpoint.sqlite import SqliteSaver
+import config
+
+
+class ConversationStore(SqliteSaver):
+    """
+    Disk-backed checkpointer of the agent threads, shared by every session.
+
+    The conversations survive session spills and restarts. Every turn writes a few
+    checkpoints, prune() keeps only the last keep_checkpoints of a thread; each
+    checkpoint holds the whole state, whose message window is bounded by AgentState.
+    """
+
+    def __init__(self, path=config.CHECKPOINT_DB, keep_checkpoints=config.CHECKPOINTS_PER_THREAD):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # The saver serializes its own accesses, the connection is used from the chat threads
+        super().__init__(sqlite3.connect(path, check_same_thread=False))
+        self.keep_checkpoints = keep_checkpoints
+
+    def prune(self, thread_id):
+        with self.cursor() as cur:
+            # Checkpoint ids are time ordered
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, thread_id, self.keep_checkpoints),
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            )
+
+    def delete_thread(self, thread_id):
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
@@ -1,17 +1,68 @@
 import pandas as pd
+import numpy as np
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import BaseTool, StructuredTool, tool
 from datetime import datetime
-from sklearn.impute import KNNImputer
 from sklearn.preprocessing import LabelEncoder
-import matplotlib.pyplot as plt
-import os
+import hashlib
+from dataset_store import DatasetStore
+from data_history import DataHistory
+from compute_pool import compute_pool, knn_impute, correlations_with
+import charts
+from chart_cache import ChartCache
+import config
+from date_parsing import parse_date_columns
+from compact_dtypes import compact_dtypes, memory_report
 class DataExtractor:
     def __init__(self, csv_file, user_id):
         self.user_id = user_id
-        self.data = self.process_data_types(csv_file)
+        self.dataset = DatasetStore(user_id)
+        self._data = None
+        self._memory_usage = None
+        self._fingerprint = None
+        self._base_fingerprint = None
+        # Row mask of the filters not applied yet, relative to the frame in self._data
+        self._pending_mask = None
+        # Bumped by every modification, analysis results are memoized per version
+        self.data_version = 0
+        self._analysis_cache = {}
+        # Format and parse time of the date columns detected on upload
+        self.date_report = {}
+        # Bytes per column before/after the dtype conversion of the upload
+        self.memory_report = {}
+        self.chart_cache = ChartCache(user_id)
+        history = None
+        if csv_file is None:
+            # Reattach to the dataset and version history persisted by a previous session
+            history = DataHistory.from_disk(user_id)
+            if history is not None and history.dataset_version != history.current:
+                # Stopped with changes not in the dataset file yet (pending filters)
+                self.data = history.build(history.current)
+                history.mark_saved()
+            else:
+                self._data = self.dataset.load()
+        else:
+            self.data = self.process_data_types(csv_file)
         self.columns = self.get_column_values_info(self.data)
+        self.history = history or DataHistory(user_id, self.data.columns)
        
+        self.build_tools()
+
+        self.date_columns = [col for col in self.columns if self.columns[col]['dtype'].startswith('datetime')]
+
+    @classmethod
+    def from_disk(cls, user_id):
+        return cls(None, user_id)
+
+    @classmethod
+    def tool_schemas(cls):
+        # Instance without a dataset, only the names and schemas of its tools are used
+        # to bind them to the LLM once per process
+        template = cls.__new__(cls)
+        template.build_tools()
+        return template
+
+    def build_tools(self):
         self.data_modifications_tools = [
         # data modification tools
         self.get_tool_data_range(),
@@ -57,17 +108,129 @@ class DataExtractor:
         
         # Store the tools in a dictionary by name
         self.tools = {tool.name: tool for tool in all_tools}
- 
-        
-        self.date_columns = [col for col in self.columns if self.columns[col]['dtype'].startswith('datetime')]
-
 
+    @property
+    def data(self):
+        # Pending filters are applied the first time the rows are actually needed
+        self.load_base()
+        if self._pending_mask is not None:
+            self.materialize()
+        return self._data
+
+    @data.setter
+    def data(self, df):
+        self._data = df
+        self.save_data()
+
+    def load_base(self):
+        # The working dataset lives on disk and is only loaded while it is being used
+        if self._data is None:
+            self._data = self.dataset.load()
+        return self._data
+
+    def save_data(self, columns=None):
+        # Persist the working dataset, called after every modification. Tools that only
+        # change some columns in place pass them, the other columns are not rewritten.
+        if columns is None:
+            self.dataset.save(self._data)
+        else:
+            self.dataset.save_columns(self._data, columns)
+        self._memory_usage = None
+        self._base_fingerprint = None
+        self.mark_modified()
+
+    def mark_modified(self):
+        self._fingerprint = None
+        self.data_version += 1
+        self._analysis_cache.clear()
+
+    def materialize(self):
+        # Select the rows of all the pending filters in a single pass and persist them.
+        # The content does not change, so the version and fingerprint are kept.
+        self._data = self._data[self._pending_mask]
+        self._pending_mask = None
+        self.dataset.save(self._data)
+        self._memory_usage = None
+        self._base_fingerprint = None
+
+    def shared_dataset(self):
+        # Dataset file read by the compute pool jobs. Every modification is persisted,
+        # only the pending filters have to be applied first.
+        if self._pending_mask is not None:
+            self.materialize()
+        return self.dataset
+
+    def release(self):
+        # Drop the in-memory copy, the next access loads it again from the dataset file.
+        # A new session is rebuilt from disk only, so pending filters are applied first.
+        if self._pending_mask is not None:
+            self.materialize()
+        self.history.mark_saved()
+        self._data = None
+        self._memory_usage = None
+
+    def memory_usage(self):
+        # Bytes held by the in-memory dataset and the version history
+        if self._data is None:
+            return self.history.memory_usage()
+        if self._memory_usage is None:
+            self._memory_usage = int(self._data.memory_usage(deep=True).sum())
+        return self._memory_usage + self.history.memory_usage()
+
+    ###################### VERSION HISTORY #########################
+
+    def undo(self):
+        return self.load_version(self.history.undo())
+
+    def redo(self):
+        return self.load_version(self.history.redo())
+
+    def checkpoint(self, name):
+        return self.history.checkpoint(name)
+
+    def restore_checkpoint(self, name):
+        return self.load_version(self.history.restore(name))
+
+    def load_version(self, version_id):
+        # Make a version of the history the working dataset, False if there is none
+        if version_id is None:
+            return False
+        self._pending_mask = None
+        self.data = self.history.build(version_id)
+        self.columns = self.get_column_values_info(self.data)
+        return True
+
+    def memoized(self, tool_name, args, compute):
+        # Analysis results are reused until a modification bumps the data version
+        key = (tool_name, args, self.data_version)
+        if key not in self._analysis_cache:
+            self._analysis_cache[key] = compute()
+        return self._analysis_cache[key]
+
+    def fingerprint(self):
+        # Content hash of the working dataset, computed once per modification
+        if self._fingerprint is None:
+            if self._base_fingerprint is None:
+                base = self.load_base()
+                row_hashes = pd.util.hash_pandas_object(base, index=True).values
+                digest = hashlib.sha1(row_hashes.tobytes())
+                digest.update(str(list(base.dtypes.items())).encode())
+                self._base_fingerprint = digest.hexdigest()
+            digest = hashlib.sha1(self._base_fingerprint.encode())
+            if self._pending_mask is not None:
+                # Hash the filters instead of materializing them
+                digest.update(np.packbits(self._pending_mask).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
 
     def process_data_types(self, csv_file):
         df = csv_file
+        memory_before = df.memory_usage(deep=True, index=False)
         df = self.format_date(df)
         df = df.convert_dtypes()
-       
+        if config.COMPACT_DTYPES:
+            df = compact_dtypes(df)
+        self.memory_report = memory_report(memory_before, df)
 
         return df
     def get_column_values_info(self,data):
@@ -79,14 +242,66 @@ class DataExtractor:
    
         return combined_info_dict
 
-    def format_date(self, df):
-        string_cols = [col for col, col_type in df.dtypes.items() if col_type == 'object']
-
-        if len(string_cols) > 0:
-            mask = df[string_cols].apply(lambda x: x.str.match(r'(\d{2,4}(-|\/|\\|\.| )\d{2}(-|\/|\\|\.| )\d{2,4})+').any(), axis=0)
-
-            df.loc[:, mask.index[mask]] = df.loc[:, mask.index[mask]].apply(pd.to_datetime, dayfirst=False, errors='coerce')
+    def update_column_values_info(self, column_names):
+        # Recompute the info of the modified columns only, the rest of the frame is untouched
+        for col in column_names:
+            series = self.data[col]
+            self.columns[col] = {'dtype': str(series.dtype), 'na_count': int(series.isna().sum())}
+
+    def commit_columns(self, column_names, description):
+        # Called after the values of some columns were replaced
+        self.update_column_values_info(column_names)
+        self.history.record_columns({col: self.data[col] for col in column_names}, description)
+
+    def filtered_column_values_info(self, data, mask):
+        # Info of data[mask] derived from the current one: dtypes do not change with a
+        # row filter and only the columns that had missing values need to be recounted
+        columns = {col: dict(info) for col, info in self.columns.items()}
+        for col, info in columns.items():
+            if info['na_count']:
+                info['na_count'] = int(np.count_nonzero(data[col].isna().to_numpy() & mask))
+        return columns
+
+    def filter_source(self, column_name):
+        # Column the filter masks are computed on, before any pending filter
+        return self.load_base()[column_name]
+
+    def filtered_column(self, column_name):
+        # Single column of the filtered data, without materializing the whole frame
+        column = self.filter_source(column_name)
+        return column if self._pending_mask is None else column[self._pending_mask]
+
+    def head(self, n=5):
+        # First rows of the filtered data, without materializing the pending filters
+        if self._pending_mask is None:
+            return self.data.head(n)
+        return self.load_base().iloc[np.flatnonzero(self._pending_mask)[:n]]
+
+    def row_count(self):
+        if self._pending_mask is not None:
+            return int(np.count_nonzero(self._pending_mask))
+        return len(self.data)
+
+    def filter_rows(self, mask, description):
+        # Keep the rows selected by a boolean mask computed on filter_source columns.
+        # With LAZY_FILTERS the mask is only combined with the pending ones.
+        mask = mask.fillna(False).to_numpy(dtype=bool)
+        if self._pending_mask is not None:
+            mask &= self._pending_mask
+            self.history.record_rows(mask[self._pending_mask], description)
+        else:
+            self.history.record_rows(mask, description)
+        self.columns = self.filtered_column_values_info(self.load_base(), mask)
+        if config.LAZY_FILTERS:
+            self._pending_mask = mask
+            self.mark_modified()
+        else:
+            self.data = self._data[mask]
 
+    def format_date(self, df):
+        # Formats are detected on a sample of each text column, then every date
+        # column is parsed in one vectorized call with its explicit format
+        df, self.date_report = parse_date_columns(df, self.user_id)
         return df
     
     def create_correlation_matrix(self):
@@ -128,12 +343,13 @@ class DataExtractor:
             start_date = pd.to_datetime(start_date)
             end_date = pd.to_datetime(end_date)
             
-            mask = (self.data[column_name] >= start_date) & (self.data[column_name] <= end_date)
-            self.data = self.data.loc[mask]
-            self.columns = self.get_column_values_info(self.data.loc[mask])
+            dates = self.filter_source(column_name)
+            mask = (dates >= start_date) & (dates <= end_date)
+            self.filter_rows(mask, f"date range {start_date.date()} to {end_date.date()} on '{column_name}'")
            
-            first_date = self.data[column_name].min()
-            last_date = self.data[column_name].max()
+            dates = self.filtered_column(column_name)
+            first_date = dates.min()
+            last_date = dates.max()
 
             return f"The update was succesful, the first date is {first_date} and the last date is {last_date}"
 
@@ -171,16 +387,15 @@ class DataExtractor:
             Filter rows in a dataframe based on whether a column value starts with or equals a given string.
             If include is True, it includes the rows; otherwise, it excludes them.
             """
-            pre_number_rows = len(self.data)
+            pre_number_rows = self.row_count()
+            values = self.filter_source(column_name)
             if include:
-                mask = self.data[column_name].str.startswith(string_filter) | (self.data[column_name] == string_filter)
-                self.data = self.data[mask]
+                mask = values.str.startswith(string_filter) | (values == string_filter)
             else:
-                mask = ~(self.data[column_name].str.startswith(string_filter) | (self.data[column_name] == string_filter))
-                self.data = self.data[mask]
-            
-            self.columns = self.get_column_values_info(self.data)
-            return f"The data has been filtered succesfully: {pre_number_rows} --> {len(self.data)} rows."
+                mask = ~(values.str.startswith(string_filter) | (values == string_filter))
+            self.filter_rows(mask, f"{'keep' if include else 'exclude'} '{string_filter}' in '{column_name}'")
+
+            return f"The data has been filtered succesfully: {pre_number_rows} --> {self.row_count()} rows."
          
 
         return tool_filter_string
@@ -192,24 +407,24 @@ class DataExtractor:
             Filter rows in a dataframe where numeric values in a column meet the specified condition.
             Comparison operators: '>', '<', '=', '>=', '<='
             """
-            pre_number_rows = len(self.data)
+            pre_number_rows = self.row_count()
+            values = self.filter_source(column_name)
             if comparison == '>':
-                mask = self.data[column_name] > value
+                mask = values > value
             elif comparison == '<':
-                mask = self.data[column_name] < value
+                mask = values < value
             elif comparison == '=':
-                mask = self.data[column_name] == value
+                mask = values == value
             elif comparison == '>=':
-                mask = self.data[column_name] >= value
+                mask = values >= value
             elif comparison == '<=':
-                mask = self.data[column_name] <= value
+                mask = values <= value
             else:
                 return "Invalid comparison operator. Use one of: '>', '<', '=', '>=', '<='."
             
-            self.data = self.data[mask]
-            self.columns = self.get_column_values_info(self.data)
+            self.filter_rows(mask, f"filter '{column_name}' {comparison} {value}")
             print("hasta aqui llega")
-            return f"The data has been filtered succesfully: {pre_number_rows} --> {len(self.data)} rows."
+            return f"The data has been filtered succesfully: {pre_number_rows} --> {self.row_count()} rows."
 
         return tool_filter_numeric
     
@@ -224,23 +439,24 @@ class DataExtractor:
             - date_part (str): The part of the date to filter by ('year', 'month', 'day').
             - value (int): The year, month, or day to filter on.
             """
-            pre_number_rows = len(self.data)
+            pre_number_rows = self.row_count()
+            dates = self.filter_source(column_name)
             
             # Apply the filter based on the date_part
             if date_part == 'year':
-                mask = self.data[column_name].dt.year == value
+                mask = dates.dt.year == value
             elif date_part == 'month':
-                mask = self.data[column_name].dt.month == value
+                mask = dates.dt.month == value
             elif date_part == 'day':
-                mask = self.data[column_name].dt.day == value
+                mask = dates.dt.day == value
             else:
                 return "Invalid date part. Use one of: 'year', 'month', 'day'."
             
             # Filter the data
-            self.data = self.data[mask]
+            self.filter_rows(mask, f"filter '{column_name}' by {date_part} {value}")
             
             
-            return f"The data has been filtered by {date_part} successfully: {pre_number_rows} --> {len(self.data)} rows."
+            return f"The data has been filtered by {date_part} successfully: {pre_number_rows} --> {self.row_count()} rows."
     
         return tool_filter_date
     
@@ -252,8 +468,9 @@ class DataExtractor:
             Drop a specified column from the dataframe.
             """
             if column_name in self.data.columns:
-                self.data.drop(columns=[column_name], inplace=True)
-                self.columns = self.get_column_values_info(self.data)
+                self.data = self.data.drop(columns=[column_name])
+                del self.columns[column_name]
+                self.history.record_drop([column_name], f"drop '{column_name}'")
                 return f"Column '{column_name}' was successfully dropped."
             else:
                 return f"Column '{column_name}' not found in the dataframe."
@@ -268,13 +485,15 @@ class DataExtractor:
             """
             Analyze and report the percentage of missing values per column.
             """
-            total_len = len(self.data)
-            missing_values_text = f"Missing values information:\n\n"
-            for column_name, value in self.columns.items():
-                missing_values_text += f"{column_name}: total:{value['na_count']} --->  {value['na_count']/total_len * 100:.2f}%\n\n"  # Round to 2 decimals
-        
-            return missing_values_text
-            
+            def compute():
+                total_len = len(self.data)
+                missing_values_text = f"Missing values information:\n\n"
+                for column_name, value in self.columns.items():
+                    missing_values_text += f"{column_name}: total:{value['na_count']} --->  {value['na_count']/total_len * 100:.2f}%\n\n"  # Round to 2 decimals
+
+                return missing_values_text
+
+            return self.memoized('tool_missing_values', (), compute)
         return tool_missing_values
     def get_tool_impute_mean_median(self):
         @tool
@@ -295,15 +514,21 @@ class DataExtractor:
             else:
                 return "Error: Invalid strategy. Use 'mean' or 'median'."
             
-            self.data[column_name].fillna(value_to_fill, inplace=True)
-            self.columns = self.get_column_values_info(self.data)
+            values = self.data[column_name]
+            if pd.api.types.is_integer_dtype(values) and value_to_fill != round(value_to_fill):
+                # Fractional mean of an integer column
+                values = values.astype('Float64')
+            self.data[column_name] = values.fillna(value_to_fill)
+            self.save_data([column_name])
+            self.commit_columns([column_name], f"impute '{column_name}' with {strategy}")
             return f"Imputed missing values in '{column_name}' using {strategy}."
         
         return tool_impute_mean_median
     
     def get_tool_knn_imputation(self):
         @tool
-        def tool_knn_imputation(columns: list[str], n_neighbors: int = 5) -> str:
+        def tool_knn_imputation(columns: list[str], n_neighbors: int = 5, group_column: str = None,
+                                time_column: str = None, time_window: str = None) -> str:
             """
         Perform K-Nearest Neighbors imputation for numerical columns.
         
@@ -311,10 +536,14 @@ class DataExtractor:
         - Data is numerical (int or float).
         - Missing percentage is moderate (e.g., between 10% and 40%).
         - You want to consider the relationships between data points to impute values based on similar rows.
+
+        Optionally the neighbours are restricted to rows with the same value of group_column
+        and/or in the same time_window ('D', 'W', 'M' or 'Y') of the date column time_column.
         """
-            imputer = KNNImputer(n_neighbors=n_neighbors)
-            self.data[columns] = imputer.fit_transform(self.data[columns])
-            self.columns = self.get_column_values_info(self.data)
+            self.data[columns] = compute_pool.run(knn_impute, self.shared_dataset(), columns, n_neighbors,
+                                                  group_column, time_column, time_window)
+            self.save_data(columns)
+            self.commit_columns(columns, f"KNN imputation of {', '.join(columns)}")
             return f"KNN imputation completed for columns: {', '.join(columns)}."
         
         return tool_knn_imputation
@@ -333,8 +562,9 @@ class DataExtractor:
             if method not in ["linear", "polynomial"]:
                 return "Error: Invalid interpolation method. Use 'linear' or 'polynomial'."
             
-            self.data[column_name].interpolate(method=method, inplace=True)
-            self.columns = self.get_column_values_info(self.data)
+            self.data[column_name] = self.data[column_name].interpolate(method=method)
+            self.save_data([column_name])
+            self.commit_columns([column_name], f"{method} interpolation of '{column_name}'")
             return f"Interpolated missing values in '{column_name}' using {method} interpolation."
         
         return tool_interpolation
@@ -351,8 +581,9 @@ class DataExtractor:
         - There is a dominant category (mode) that represents the majority of the data.
         """
             mode_value = self.data[column_name].mode()[0]
-            self.data[column_name].fillna(mode_value, inplace=True)
-            self.columns = self.get_column_values_info(self.data)
+            self.data[column_name] = self.data[column_name].fillna(mode_value)
+            self.save_data([column_name])
+            self.commit_columns([column_name], f"impute '{column_name}' with mode")
             return f"Imputed missing values in '{column_name}' using mode (most frequent value)."
         
         return tool_impute_mode
@@ -369,8 +600,12 @@ class DataExtractor:
         - Missing percentage is moderate to high (e.g., 20% - 50%).
         - The missing data can be safely represented with a placeholder.
         """
-            self.data[column_name].fillna(placeholder, inplace=True)
-            self.columns = self.get_column_values_info(self.data)
+            values = self.data[column_name]
+            if isinstance(values.dtype, pd.CategoricalDtype) and placeholder not in values.cat.categories:
+                values = values.cat.add_categories([placeholder])
+            self.data[column_name] = values.fillna(placeholder)
+            self.save_data([column_name])
+            self.commit_columns([column_name], f"impute '{column_name}' with '{placeholder}'")
             return f"Imputed missing values in '{column_name}' with placeholder '{placeholder}'."
         
         return tool_impute_placeholder
@@ -389,13 +624,14 @@ class DataExtractor:
         """   
 
             if direction == "forward":
-                self.data[column_name].ffill(inplace=True)
+                self.data[column_name] = self.data[column_name].ffill()
             elif direction == "backward":
-                self.data[column_name].bfill(inplace=True)
+                self.data[column_name] = self.data[column_name].bfill()
             else:
                 return "Error: Invalid direction. Use 'forward' or 'backward'."
+            self.save_data([column_name])
                 
-            self.columns = self.get_column_values_info(self.data)
+            self.commit_columns([column_name], f"{direction} fill of '{column_name}'")
             return f"Performed {direction} fill on '{column_name}'."
         
             
@@ -408,12 +644,15 @@ class DataExtractor:
             """
             Provide basic descriptive statistics for a given numeric column.
             """
-            desc = self.data[column_name].describe()
-            stats_text = f"Descriptive stats for {column_name}:\n\n"
-            for stat_name, value in desc.items():
-                stats_text += f"{stat_name}: {value:.2f}\n\n"  # Round to 2 decimals
-        
-            return stats_text
+            def compute():
+                desc = self.data[column_name].describe()
+                stats_text = f"Descriptive stats for {column_name}:\n\n"
+                for stat_name, value in desc.items():
+                    stats_text += f"{stat_name}: {value:.2f}\n\n"  # Round to 2 decimals
+
+                return stats_text
+
+            return self.memoized('tool_descriptive_statistics', (column_name,), compute)
         return tool_descriptive_statistics
     
     ## THIS FUCTION HAS TO BE REVIEWED
@@ -425,23 +664,11 @@ class DataExtractor:
             and return the top 5 columns most correlated with the specified column,
             excluding index-related columns.
             """
-            # Filter numeric columns only
-            numeric_data = self.data.select_dtypes(include=['number'])
-
-            # Exclude likely index columns (e.g., 'id', 'index')
-            excluded_columns = [col for col in numeric_data.columns if 'id' in col.lower() or 'index' in col.lower()]
-            filtered_data = numeric_data.drop(columns=excluded_columns, errors='ignore')
-
-            # Check if the specified column is in the filtered data
-            if column_name not in filtered_data.columns:
-                return f"The specified column '{column_name}' is not numeric and cannot be analyzed for correlation."
+            def compute():
+                sorted_corr = compute_pool.run(correlations_with, self.shared_dataset(), column_name)
+                if sorted_corr is None:
+                    return f"The specified column '{column_name}' is not numeric and cannot be analyzed for correlation."
 
-            # Calculate the correlation matrix
-            corr_matrix = filtered_data.corr()
-
-            # Get correlations with the desired column and sort them
-            if column_name in corr_matrix.columns:
-                sorted_corr = corr_matrix[column_name].abs().sort_values(ascending=False)
                 top_5 = sorted_corr.index[1:6]  # Skip the column itself
                 top_5_correlations = sorted_corr[1:6] * 100  # Convert to percentage
 
@@ -449,9 +676,8 @@ class DataExtractor:
                 result = f"Top 5 columns most correlated with '{column_name}':\n\n"
                 result += "\n\n".join([f"{col}: {corr:.2f}%" for col, corr in zip(top_5, top_5_correlations)])
                 return result
-            else:
-                return f"Column '{column_name}' not found in the numeric columns of the dataset."
-            
+
+            return self.memoized('tool_correlation_matrix', (column_name,), compute)
         return tool_correlation_matrix
 
     
@@ -462,12 +688,17 @@ class DataExtractor:
             """
             Provide the frequency distribution of a given column.
             """
-            value_counts = self.data[column_name].value_counts()
-            total_len = len(self.data)
-            frequency_text = f"Frequency analysis for {column_name}:\n\n"
-            for stat_name, value in value_counts.items():
-                frequency_text += f"{stat_name}: total: {value} --> {value/total_len*100:.2f}% \n\n"  # Round to 2 decimals
-            return frequency_text
+            def compute():
+                value_counts = self.data[column_name].value_counts()
+                # Categories left without rows by a filter are not reported
+                value_counts = value_counts[value_counts > 0]
+                total_len = len(self.data)
+                frequency_text = f"Frequency analysis for {column_name}:\n\n"
+                for stat_name, value in value_counts.items():
+                    frequency_text += f"{stat_name}: total: {value} --> {value/total_len*100:.2f}% \n\n"  # Round to 2 decimals
+                return frequency_text
+
+            return self.memoized('tool_value_counts', (column_name,), compute)
         return tool_value_counts
     
     def get_tool_outlier_detection(self):
@@ -476,25 +707,28 @@ class DataExtractor:
             """
             Detect outliers in a numeric column using the IQR method.
             """
-            Q1 = self.data[column_name].quantile(0.25)
-            Q3 = self.data[column_name].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            outliers = self.data[(self.data[column_name] < lower_bound) | (self.data[column_name] > upper_bound)][column_name]
-            total_len = len(self.data)
-            # Create the output message with the percentage of outliers
-            outliers_percentage = (len(outliers) / total_len) * 100
-            outliers_info = f"Outliers detected: {len(outliers)} rows with outliers in {column_name}, representing {outliers_percentage:.2f}% of the total data.\n\n"
-            
-            # If there are outliers, add details of up to 5 principal ones
-            if not outliers.empty:
-                outliers_info += "Principal outliers:\n\n"
-                for i in range(min(5, len(outliers))):
-                    outlier_value = outliers.iloc[i]
-                    outliers_info += f"{i + 1}: {outlier_value}\n\n"
-            
-            return outliers_info
+            def compute():
+                Q1 = self.data[column_name].quantile(0.25)
+                Q3 = self.data[column_name].quantile(0.75)
+                IQR = Q3 - Q1
+                lower_bound = Q1 - 1.5 * IQR
+                upper_bound = Q3 + 1.5 * IQR
+                outliers = self.data[(self.data[column_name] < lower_bound) | (self.data[column_name] > upper_bound)][column_name]
+                total_len = len(self.data)
+                # Create the output message with the percentage of outliers
+                outliers_percentage = (len(outliers) / total_len) * 100
+                outliers_info = f"Outliers detected: {len(outliers)} rows with outliers in {column_name}, representing {outliers_percentage:.2f}% of the total data.\n\n"
+
+                # If there are outliers, add details of up to 5 principal ones
+                if not outliers.empty:
+                    outliers_info += "Principal outliers:\n\n"
+                    for i in range(min(5, len(outliers))):
+                        outlier_value = outliers.iloc[i]
+                        outliers_info += f"{i + 1}: {outlier_value}\n\n"
+
+                return outliers_info
+
+            return self.memoized('tool_outlier_detection', (column_name,), compute)
         return tool_outlier_detection
     
     def get_tool_trend_analysis(self):
@@ -505,31 +739,35 @@ class DataExtractor:
             and anomaly detection, providing detailed statistical insights.
             """
             # Calculate moving average
-            self.data['moving_average'] = self.data[column_name].rolling(window=window).mean()
+            # Kept as a local series, the working dataset is not modified by an analysis.
+            # The arithmetic is done in float64: compacted columns can be Int8/Int16 and
+            # their scalars would overflow.
+            values = self.data[column_name].astype('float64')
+            moving_average = values.rolling(window=window).mean()
 
             # Trend direction and volatility
-            recent_trend = "upward" if self.data['moving_average'].iloc[-1] > self.data['moving_average'].iloc[-window] else "downward"
-            overall_trend = "upward" if self.data['moving_average'].iloc[-1] > self.data['moving_average'].iloc[0] else "downward"
-            volatility = self.data[column_name].rolling(window=window).std().mean()
+            recent_trend = "upward" if moving_average.iloc[-1] > moving_average.iloc[-window] else "downward"
+            overall_trend = "upward" if moving_average.iloc[-1] > moving_average.iloc[0] else "downward"
+            volatility = values.rolling(window=window).std().mean()
 
             # Stability and changes in direction
-            trend_changes = self.data['moving_average'].diff().fillna(0)
+            trend_changes = moving_average.diff().fillna(0)
             trend_change_count = sum((trend_changes > 0) != (trend_changes.shift(-1) > 0))
             stability = "stable" if trend_change_count < window else "volatile"
             
             # Rate of change and cumulative change
-            cumulative_change = ((self.data[column_name].iloc[-1] - self.data[column_name].iloc[0]) / self.data[column_name].iloc[0]) * 100
+            cumulative_change = ((values.iloc[-1] - values.iloc[0]) / values.iloc[0]) * 100
             avg_rate_of_change = trend_changes.abs().mean()
 
             # Percentage change in last window and extremes
-            recent_percentage_change = ((self.data['moving_average'].iloc[-1] - self.data['moving_average'].iloc[-window]) / self.data['moving_average'].iloc[-window]) * 100
+            recent_percentage_change = ((moving_average.iloc[-1] - moving_average.iloc[-window]) / moving_average.iloc[-window]) * 100
             recent_max = self.data[column_name].iloc[-window:].max()
             recent_min = self.data[column_name].iloc[-window:].min()
 
             # Seasonality detection (using autocorrelation)
             seasonality_info = ""
             if seasonality_period:
-                autocorrelation = self.data[column_name].autocorr(lag=seasonality_period)
+                autocorrelation = values.autocorr(lag=seasonality_period)
                 if autocorrelation > 0.7:
                     seasonality_info = f"\nSeasonality detected with a period of {seasonality_period}. Autocorrelation: {autocorrelation:.2f}."
                 else:
@@ -553,6 +791,13 @@ class DataExtractor:
 
 # -------- TOOLS FOR CREATE GRAPHICS  ---------------
 
+    def render_chart(self, renderer, chart_type, columns, style):
+        # Name of the chart file. Charts are cached by content, the same chart of
+        # unchanged data is served from disk instead of being rendered again.
+        def render(fig_path):
+            compute_pool.run(renderer, self.shared_dataset(), *columns, *style, fig_path)
+        return self.chart_cache.get_or_render(chart_type, columns, style, self.fingerprint(), render)
+
     def get_tool_bar_chart(self):
         @tool
         def tool_bar_chart(column_name: str, color: str = 'red') -> str:
@@ -563,23 +808,7 @@ class DataExtractor:
             if not pd.api.types.is_categorical_dtype(self.data[column_name]) and not pd.api.types.is_object_dtype(self.data[column_name]):
                 return f"Error: Column '{column_name}' must be categorical for a bar chart."
 
-            fig, ax = plt.subplots()
-            value_counts = self.data[column_name].value_counts()
-            value_counts.plot(kind='bar', color=color, ax=ax)
-            ax.set_title(f"Bar Chart: {column_name}")
-            ax.set_xlabel(column_name)
-            ax.set_ylabel("Count")
-
-            # Save the figure
-            charts_folder = f'./users_data/{self.user_id}/charts'
-            if not os.path.exists(charts_folder):
-                os.makedirs(charts_folder)
-            
-            chart_name = f"bar_chart_{column_name}.png"
-            fig_path = os.path.join(charts_folder, chart_name)
-            fig.savefig(fig_path)
-            
-            plt.close(fig)  # Close the figure after saving to free memory
+            chart_name = self.render_chart(charts.bar_chart, 'bar_chart', [column_name], (color,))
             return f"Figure: {chart_name}"
 
         return tool_bar_chart
@@ -596,35 +825,10 @@ class DataExtractor:
             For categorical columns, it will create a bar chart.
             """
             
-            # Check the data type of the column
-            if pd.api.types.is_numeric_dtype(self.data[column_name]):
-                # For numeric columns, create a histogram
-                fig, ax = plt.subplots()
-                self.data[column_name].plot(kind='hist', color=color, alpha=0.7, ax=ax)
-                ax.set_title(f"Histogram: {column_name}")
-                ax.set_xlabel("Value")
-                ax.set_ylabel("Frequency")
-            else:
-                # For categorical columns, create a bar chart
-                fig, ax = plt.subplots()
-                value_counts = self.data[column_name].value_counts()
-                value_counts.plot(kind='bar', color=color, alpha=0.7, ax=ax)
-                ax.set_title(f"Bar Chart: {column_name}")
-                ax.set_xlabel(column_name)
-                ax.set_ylabel("Count")
-
-            # Save the figure to the graphs folder
-         
-            if not os.path.exists(f'./users_data/{self.user_id}/charts'):
-               
-                os.makedirs(f'./users_data/{self.user_id}/charts')
-
-            chart_name = f"chart_{column_name}.png"
-            fig_path = os.path.join(f'./users_data/{self.user_id}/charts/', chart_name)
-           
-            fig.savefig(fig_path)
+            # Numeric columns get a histogram, categorical ones a bar chart
+            numeric = pd.api.types.is_numeric_dtype(self.data[column_name])
 
-            plt.close(fig)  # Close the figure after saving to free memory
+            chart_name = self.render_chart(charts.histogram, 'chart', [column_name], (color, numeric))
 
             # Return the name of the chart for later use in the response message
             return f"Figure: {chart_name}"
@@ -642,22 +846,7 @@ class DataExtractor:
             if not pd.api.types.is_numeric_dtype(self.data[column_name]):
                 return f"Error: Column '{column_name}' must be numeric for a line chart."
 
-            fig, ax = plt.subplots()
-            ax.plot(self.data.index, self.data[column_name], color=color)
-            ax.set_title(f"Line Chart: {column_name}")
-            ax.set_xlabel("Index")
-            ax.set_ylabel(column_name)
-
-            # Save the figure
-            charts_folder = f'./users_data/{self.user_id}/charts'
-            if not os.path.exists(charts_folder):
-                os.makedirs(charts_folder)
-            
-            chart_name = f"line_chart_{column_name}.png"
-            fig_path = os.path.join(charts_folder, chart_name)
-            fig.savefig(fig_path)
-            
-            plt.close(fig)  # Close the figure after saving to free memory
+            chart_name = self.render_chart(charts.line_chart, 'line_chart', [column_name], (color,))
             return f"Figure: {chart_name}"
 
         return tool_line_chart
@@ -676,23 +865,7 @@ class DataExtractor:
                 return f"Error: Both columns must be numeric for a scatter plot."
 
             print(f"Creating scatter plot: {x_column} vs {y_column}")
-            # Create the scatter plot
-            fig, ax = plt.subplots()
-            ax.scatter(self.data[x_column], self.data[y_column], color=color)
-            ax.set_title(f"Scatter Plot: {x_column} vs {y_column}")
-            ax.set_xlabel(x_column)
-            ax.set_ylabel(y_column)
-
-            # Save the figure
-            charts_folder = f'./users_data/{self.user_id}/charts'
-            if not os.path.exists(charts_folder):
-                os.makedirs(charts_folder)
-            
-            chart_name = f"scatter_plot_{x_column}_vs_{y_column}.png"
-            fig_path = os.path.join(charts_folder, chart_name)
-            fig.savefig(fig_path)
-
-            plt.close(fig)  # Close the figure after saving to free memory
+            chart_name = self.render_chart(charts.scatter_plot, 'scatter_plot', [x_column, y_column], (color,))
             return f"Figure: {chart_name}"
 
         return tool_scatter_plot
@@ -0,0 +1,213 @@
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+from dataset_store import DatasetStore
+
+
+class DataHistory:
+    """
+    Version tree of a user's working dataset, with undo/redo and named checkpoints.
+
+    The root version is the dataset the history was started from, kept as an Arrow
+    file next to the working one. Every modification adds a child of the current
+    version that only stores what changed: the row positions kept by a filter, the
+    new values of the imputed columns or the names of the dropped columns. A version
+    is rebuilt by replaying the changes on the path from the root, reading only the
+    root columns that were not replaced. Editing after an undo starts a new branch,
+    the previous one stays reachable through its checkpoints.
+
+    The history is persisted next to the root: the row positions and replaced columns
+    of every version as Arrow files and the tree, undo/redo state and checkpoints in
+    history.json, so it survives session spills and restarts.
+    """
+
+    def __init__(self, user_id, column_names):
+        self.user_id = user_id
+        self.root = DatasetStore(user_id, 'history_root.arrow')
+        DatasetStore(user_id).copy_to(self.root)
+        # Files of the history of a previous upload
+        for path in glob.glob(os.path.join(self.root.folder, 'history_v*.arrow')):
+            os.remove(path)
+        self.root_columns = list(column_names)
+        self.versions = []
+        self.redo_stack = []
+        self.checkpoints = {}
+        # Version the persisted working dataset holds
+        self.dataset_version = 0
+        self._add(self._version(None, 'uploaded dataset'))
+
+    @classmethod
+    def from_disk(cls, user_id):
+        # History saved by a previous session, None if there is none
+        history = cls.__new__(cls)
+        history.user_id = user_id
+        history.root = DatasetStore(user_id, 'history_root.arrow')
+        if not history.root.exists() or not os.path.exists(history._index_path()):
+            return None
+
+        with open(history._index_path()) as f:
+            index = json.load(f)
+        history.root_columns = index['root_columns']
+        history.current = index['current']
+        history.redo_stack = index['redo_stack']
+        history.checkpoints = index['checkpoints']
+        history.dataset_version = index['dataset_version']
+        history.versions = [history._read_version(entry) for entry in index['versions']]
+        return history
+
+    def record_rows(self, mask, description):
+        # mask selects the kept rows of the current version
+        positions = np.flatnonzero(mask)
+        positions = positions.astype(np.min_scalar_type(max(len(mask) - 1, 0)))
+        self._add(self._version(self.current, description, rows=positions))
+
+    def record_columns(self, columns, description):
+        # columns: {name: Series} with the new values, aligned with the current version
+        columns = {name: series.copy() for name, series in columns.items()}
+        self._add(self._version(self.current, description, columns=columns))
+
+    def record_drop(self, column_names, description):
+        self._add(self._version(self.current, description, dropped=list(column_names)))
+
+    def undo(self):
+        parent = self.versions[self.current]['parent']
+        if parent is None:
+            return None
+        self.redo_stack.append(self.current)
+        self.current = parent
+        self._save_index()
+        return self.current
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        self.current = self.redo_stack.pop()
+        self._save_index()
+        return self.current
+
+    def checkpoint(self, name):
+        self.checkpoints[name] = self.current
+        self._save_index()
+        return self.current
+
+    def restore(self, name):
+        if name not in self.checkpoints:
+            return None
+        self.current = self.checkpoints[name]
+        self.redo_stack = []
+        self._save_index()
+        return self.current
+
+    def mark_saved(self):
+        # The working dataset on disk holds the current version
+        self.dataset_version = self.current
+        self._save_index()
+
+    def build(self, version_id):
+        # Replay the changes from the root, composing the row selections so the root
+        # columns are only taken once
+        path = []
+        version = self.versions[version_id]
+        while version is not None:
+            path.append(version)
+            version = self.versions[version['parent']] if version['parent'] is not None else None
+        path.reverse()
+
+        positions, overrides, dropped = None, {}, set()
+        for version in path[1:]:
+            if version['rows'] is not None:
+                positions = version['rows'] if positions is None else positions[version['rows']]
+                overrides = {name: series.iloc[version['rows']] for name, series in overrides.items()}
+            overrides.update(version['columns'])
+            for name in version['dropped']:
+                dropped.add(name)
+                overrides.pop(name, None)
+
+        names = [name for name in self.root_columns if name not in dropped]
+        frame = self.root.load([name for name in names if name not in overrides])
+        if positions is not None:
+            # Shallow copy so the overrides are set on a frame of its own
+            frame = frame.iloc[positions].copy(deep=False)
+        for name, series in overrides.items():
+            frame[name] = series.values
+        return frame[names]
+
+    def memory_usage(self):
+        return sum(version['memory_bytes'] for version in self.versions)
+
+    def describe(self):
+        return {
+            'current': self.current,
+            'can_undo': self.versions[self.current]['parent'] is not None,
+            'can_redo': bool(self.redo_stack),
+            'checkpoints': dict(self.checkpoints),
+            'memory_bytes': self.memory_usage(),
+            'versions': [
+                {key: version[key] for key in ('id', 'parent', 'description', 'memory_bytes')}
+                for version in self.versions
+            ],
+        }
+
+    ###################### INTERNALS #########################
+
+    def _version(self, parent, description, rows=None, columns=None, dropped=None):
+        columns = columns or {}
+        memory_bytes = rows.nbytes if rows is not None else 0
+        memory_bytes += sum(int(series.memory_usage(deep=True)) for series in columns.values())
+        return {
+            'id': len(self.versions),
+            'parent': parent,
+            'description': description,
+            'rows': rows,
+            'columns': columns,
+            'dropped': dropped or [],
+            'memory_bytes': memory_bytes,
+        }
+
+    def _add(self, version):
+        self.versions.append(version)
+        self.current = version['id']
+        self.redo_stack = []
+        self._write_version(version)
+        self._save_index()
+
+    def _index_path(self):
+        return os.path.join(self.root.folder, 'history.json')
+
+    def _store(self, version_id, part):
+        return DatasetStore(self.user_id, f'history_v{version_id}_{part}.arrow')
+
+    def _write_version(self, version):
+        # Written once, versions never change after they are added
+        if version['rows'] is not None:
+            self._store(version['id'], 'rows').save(pd.DataFrame({'rows': version['rows']}))
+        if version['columns']:
+            self._store(version['id'], 'columns').save(pd.DataFrame(version['columns']))
+
+    def _read_version(self, entry):
+        rows = self._store(entry['id'], 'rows').load()['rows'].to_numpy() if entry['rows'] else None
+        columns = {}
+        if entry['columns']:
+            frame = self._store(entry['id'], 'columns').load()
+            columns = {name: frame[name] for name in frame.columns}
+        return {**entry, 'rows': rows, 'columns': columns}
+
+    def _save_index(self):
+        index = {
+            'root_columns': self.root_columns,
+            'current': self.current,
+            'redo_stack': self.redo_stack,
+            'checkpoints': self.checkpoints,
+            'dataset_version': self.dataset_version,
+            'versions': [
+                {**version, 'rows': version['rows'] is not None, 'columns': list(version['columns'])}
+                for version in self.versions
+            ],
+        }
+        # Swapped in like the datasets, a reader never sees a partial index
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path())
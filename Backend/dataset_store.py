@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import pandas as pd
+import pyarrow as pa
+import config
+
+
+def arrow_strings(arrow_type):
+    if arrow_type in (pa.string(), pa.large_string()):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+class DatasetStore:
+    """
+    Keeps a user's working dataset as an Arrow IPC file under ./users_data/{user_id}/.
+    read_table is a zero-copy view over the memory-mapped file, load converts it into
+    a pandas copy on the heap. Columns changed in place are written to a second file
+    that overrides them, so a single imputation does not rewrite the whole dataset.
+    """
+
+    def __init__(self, user_id, file_name='dataset.arrow'):
+        self.user_id = user_id
+        self.folder = os.path.join(config.USERS_DATA_FOLDER, user_id)
+        self.path = os.path.join(self.folder, file_name)
+        self.columns_path = self.path[:-len('.arrow')] + '_changed.arrow'
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self, df: pd.DataFrame):
+        os.makedirs(self.folder, exist_ok=True)
+        write_file(pa.Table.from_pandas(df), self.path)
+        if os.path.exists(self.columns_path):
+            os.remove(self.columns_path)
+
+    def save_columns(self, df: pd.DataFrame, names):
+        # Persist columns changed in place (same rows), together with the ones already
+        # overridden. Once they are half of the dataset a full save is cheaper to read.
+        names = list(dict.fromkeys(self.changed_columns() + list(names)))
+        if 2 * len(names) > len(df.columns):
+            self.save(df)
+            return
+        write_file(pa.Table.from_pandas(df[names], preserve_index=False), self.columns_path)
+
+    def changed_columns(self):
+        if not os.path.exists(self.columns_path):
+            return []
+        with pa.memory_map(self.columns_path, 'r') as source:
+            return pa.ipc.open_file(source).schema.names
+
+    def read_table(self, columns=None) -> pa.Table:
+        # Zero-copy Arrow view over the memory-mapped file
+        table = read_file(self.path)
+        if os.path.exists(self.columns_path):
+            table = with_columns(table, read_file(self.columns_path))
+        if columns is not None:
+            # Keep the serialized pandas index alongside the requested columns
+            metadata = table.schema.pandas_metadata or {}
+            index_columns = [name for name in metadata.get('index_columns', []) if isinstance(name, str)]
+            table = table.select(list(columns) + index_columns)
+        return table
+
+    def load(self, columns=None) -> pd.DataFrame:
+        # Text columns are read back as Arrow-backed strings, not Python objects
+        return self.read_table(columns).to_pandas(types_mapper=arrow_strings)
+
+    def copy_to(self, other: 'DatasetStore'):
+        # Files are always swapped in whole, so a hard link is a copy that never changes
+        os.makedirs(other.folder, exist_ok=True)
+        other.delete()
+        link_file(self.path, other.path)
+        if os.path.exists(self.columns_path):
+            link_file(self.columns_path, other.columns_path)
+
+    def delete(self):
+        for path in (self.path, self.columns_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def write_file(table: pa.Table, path):
+    # Write to a temporary file and swap it in, readers never see a partial file
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_file(path) -> pa.Table:
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def link_file(path, other_path):
+    try:
+        os.link(path, other_path)
+    except OSError:
+        shutil.copyfile(path, other_path)
+
+
+def with_columns(table: pa.Table, changed: pa.Table) -> pa.Table:
+    # Replace the changed columns and their pandas dtypes in the serialized metadata
+    metadata = table.schema.pandas_metadata or {}
+    changed_entries = {entry['name']: entry for entry in (changed.schema.pandas_metadata or {}).get('columns', [])}
+    for name in changed.schema.names:
+        position = table.schema.get_field_index(name)
+        table = table.set_column(position, changed.schema.field(name), changed.column(name))
+    if metadata:
+        metadata['columns'] = [changed_entries.get(entry['name'], entry) for entry in metadata['columns']]
+        table = table.replace_schema_metadata({b'pandas': json.dumps(metadata).encode()})
+    return table
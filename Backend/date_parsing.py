@@ -0,0 +1,108 @@
+import re
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import config
+
+# Values that look like a date: 2024-01-31, 31/01/2024, 01.31.24, ...
+DATE_PATTERN = re.compile(r'(\d{2,4}(-|\/|\\|\.| )\d{2}(-|\/|\\|\.| )\d{2,4})+')
+
+# Formats tried on the sample, in order. Month-first comes before day-first so an
+# ambiguous column is read month-first, as pd.to_datetime(dayfirst=False) did.
+CANDIDATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M',
+    '%Y/%m/%d', '%Y/%m/%d %H:%M:%S', '%Y.%m.%d',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m-%d-%Y', '%m.%d.%Y',
+    '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y', '%d.%m.%Y',
+    '%m/%d/%y', '%d/%m/%y', '%m-%d-%y', '%d-%m-%y', '%y-%m-%d',
+]
+
+# Last format detected per (user, column name). Re-uploads of a file usually keep
+# their columns; the cached format only breaks ties between formats that parse the
+# sample equally well (ambiguous day/month dates), it never replaces the search.
+format_cache = {}
+FORMAT_CACHE_SIZE = 1024
+
+
+def sample_values(series, sample_rows):
+    # Evenly spaced rows across the column, so sorted or grouped files are covered
+    positions = np.unique(np.linspace(0, len(series) - 1, num=min(sample_rows, len(series)), dtype=np.int64))
+    return series.iloc[positions].dropna().astype(str)
+
+
+def parse_with_format(series, date_format, expected):
+    # Arrow's strptime parses the whole column in C++, much faster than pandas with an
+    # explicit non-ISO format. It is more lenient than pandas (e.g. %Y accepts two
+    # digit years), so it is only kept if it agrees with pandas on the sample
+    # (expected, the sample parsed by pandas). Values not matching become NaT.
+    try:
+        parsed = pc.strptime(pa.array(series, type=pa.string(), from_pandas=True),
+                             format=date_format, unit='ns', error_is_null=True)
+        parsed = pd.Series(parsed.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
+        if parsed.loc[expected.index].equals(expected):
+            return parsed
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        pass
+    return pd.to_datetime(series, format=date_format, errors='coerce')
+
+
+def detect_format(sample, min_parsed_ratio, cached_format=None):
+    # Best candidate format on the sample and the sample parsed with it, None if no
+    # format parses enough of it
+    best_format, best_ratio, best_parsed = None, 0.0, None
+    for date_format in CANDIDATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=date_format, errors='coerce')
+        ratio = parsed.notna().mean()
+        if ratio > best_ratio:
+            best_format, best_ratio, best_parsed = date_format, ratio, parsed
+            if ratio == 1.0:
+                break
+    if cached_format is not None and cached_format != best_format:
+        # Kept from the previous upload only if it does as well as the best one
+        parsed = pd.to_datetime(sample, format=cached_format, errors='coerce')
+        if parsed.notna().mean() == best_ratio:
+            best_format, best_parsed = cached_format, parsed
+    if best_ratio < min_parsed_ratio:
+        return None, best_ratio, None
+    return best_format, best_ratio, best_parsed
+
+
+def parse_date_columns(df, user_id=None, sample_rows=config.DATE_SAMPLE_ROWS, min_parsed_ratio=config.DATE_MIN_PARSED_RATIO):
+    """
+    Converts the text columns holding dates to datetime. The format of each column is
+    detected on a bounded sample of its rows and the whole column is then parsed with
+    that explicit format in a single vectorized call. Returns the frame and a report
+    {column: {'format', 'sample_parsed_ratio', 'seconds'}} of the converted columns.
+    Columns in a format outside CANDIDATE_FORMATS (format None in the report) are
+    parsed by pandas without an explicit format. The formats cached for user_id
+    only break ties between equally good candidates.
+    """
+    report = {}
+    string_cols = [col for col, col_type in df.dtypes.items() if col_type == 'object']
+    for col in string_cols:
+        start = time.perf_counter()
+        sample = sample_values(df[col], sample_rows)
+        if sample.empty:
+            continue
+        matched = sample.str.match(DATE_PATTERN)
+        if matched.mean() < min_parsed_ratio:
+            continue
+
+        cache_key = (user_id, col)
+        date_format, ratio, expected = detect_format(sample[matched], min_parsed_ratio, format_cache.get(cache_key))
+        if date_format is None:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+            ratio = df[col].notna().mean()
+        else:
+            df[col] = parse_with_format(df[col], date_format, expected)
+            if cache_key not in format_cache and len(format_cache) >= FORMAT_CACHE_SIZE:
+                format_cache.pop(next(iter(format_cache)))
+            format_cache[cache_key] = date_format
+        report[col] = {
+            'format': date_format,
+            'sample_parsed_ratio': round(float(ratio), 4),
+            'seconds': round(time.perf_counter() - start, 4),
+        }
+    return df, report
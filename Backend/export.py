@@ -0,0 +1,86 @@
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+import config
+
+# Formats of /download-csv: file extension, media type and CSV compression codec
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv', None),
+    'csv.gz': ('csv.gz', 'application/gzip', 'gzip'),
+    'csv.zst': ('csv.zst', 'application/zstd', 'zstd'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', None),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.stream', None),
+}
+
+
+class ChunkSink:
+    """
+    Write-only file object for the exporters: the bytes written are grouped in chunks
+    of about chunk_bytes and passed to emit(chunk), so the export can be sent while it
+    is produced without ever holding the whole file.
+    """
+
+    def __init__(self, emit, chunk_bytes=config.EXPORT_CHUNK_BYTES):
+        self.emit = emit
+        self.chunk_bytes = chunk_bytes
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.emit(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.closed = True
+
+
+def without_pandas_index(table):
+    # The datasets are saved with their pandas index, after a filter it is a column of
+    # its own. The exports only hold the data columns, like the CSV one; the rest of the
+    # pandas metadata is kept so nullable and categorical dtypes read back the same.
+    metadata = table.schema.pandas_metadata
+    if not metadata:
+        return table
+    index_columns = [name for name in metadata.get('index_columns', []) if isinstance(name, str)]
+    metadata['index_columns'] = []
+    metadata['columns'] = [column for column in metadata['columns'] if column['field_name'] not in index_columns]
+    table = table.drop_columns(index_columns)
+    return table.replace_schema_metadata({**table.schema.metadata, b'pandas': json.dumps(metadata).encode()})
+
+
+def export_table(table, export_format, emit, batch_rows=config.EXPORT_BATCH_ROWS):
+    # Writes the table in export_format batch by batch, the bytes go to emit(chunk).
+    # With the memory-mapped table of a DatasetStore, only one batch at a time is
+    # converted.
+    table = without_pandas_index(table)
+    batches = table.to_batches(max_chunksize=batch_rows)
+    sink = ChunkSink(emit)
+
+    if export_format == 'parquet':
+        with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema, compression='zstd') as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    elif export_format == 'arrow':
+        with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), table.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    else:
+        codec = EXPORT_FORMATS[export_format][2]
+        out = pa.PythonFile(sink, mode='w')
+        if codec is not None:
+            out = pa.CompressedOutputStream(out, codec)
+        # Written by pandas, the CSV is the same as the one of DataFrame.to_csv
+        for i, batch in enumerate(batches):
+            out.write(batch.to_pandas().to_csv(index=False, header=i == 0).encode())
+        if not batches:
+            out.write(table.to_pandas().to_csv(index=False).encode())
+        out.close()
+    sink.close()
@@ -0,0 +1,109 @@
+import re
+import threading
+
+# Deterministic router for prompts that name a tool and its columns explicitly,
+# e.g. "histogram of Age" or "drop column id". It only answers when the whole
+# prompt is explained by one keyword, the expected columns and filler words;
+# anything else (numbers, conditions, extra verbs) is left to the LLM.
+
+# (tool name, graph route, keyword pattern, argument names filled with the columns in order)
+INTENTS = [
+    ('tool_histogram', 'create_graphics', r'histograms?', ['column_name']),
+    ('tool_bar_chart', 'create_graphics', r'bar (?:chart|plot|graph)s?', ['column_name']),
+    ('tool_line_chart', 'create_graphics', r'line (?:chart|plot|graph)s?', ['column_name']),
+    ('tool_scatter_plot', 'create_graphics', r'scatter(?: plot| chart| graph)?s?', ['x_column', 'y_column']),
+    ('tool_drop_column', 'data_modification', r'drop|delete|remove', ['column_name']),
+    ('tool_descriptive_statistics', 'create_analysis', r'describe|descriptive statistics|statistics|stats|summary', ['column_name']),
+    ('tool_missing_values', 'create_analysis', r'missing values|na values|null values|nulls', []),
+    ('tool_value_counts', 'create_analysis', r'value counts|frequency|frequencies|distribution of values', ['column_name']),
+    ('tool_outlier_detection', 'create_analysis', r'outliers?', ['column_name']),
+    ('tool_correlation_matrix', 'create_analysis', r'correlations?|correlated', ['column_name']),
+]
+
+FILLER_WORDS = {
+    'a', 'an', 'the', 'of', 'for', 'in', 'on', 'from', 'with', 'and', 'vs', 'versus', 'against',
+    'column', 'columns', 'field', 'variable', 'please', 'show', 'me', 'plot', 'create', 'make',
+    'draw', 'give', 'get', 'display', 'compute', 'calculate', 'can', 'you', 'i', 'want', 'to',
+    'would', 'like', 'chart', 'graph', 'what', 'are', 'is', 'data', 'dataset', 'all', 'my', 'find',
+}
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r'[^\w\s/]', ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def find_columns(prompt: str, columns):
+    # Whole-word column mentions in order of appearance, longest names first so
+    # 'sales' does not shadow 'sales_usd'. Returns the columns and the prompt with
+    # the mentions blanked out.
+    variants = []
+    for column in columns:
+        for variant in {normalize(column), normalize(column.replace('_', ' '))}:
+            if variant:
+                variants.append((variant, column))
+    variants.sort(key=lambda v: len(v[0]), reverse=True)
+
+    found = []
+    for variant, column in variants:
+        for match in re.finditer(rf'(?<!\w){re.escape(variant)}(?!\w)', prompt):
+            found.append((match.start(), column))
+            prompt = prompt[:match.start()] + ' ' * len(variant) + prompt[match.end():]
+    found.sort()
+    return [column for _, column in found], prompt
+
+
+def match_fast_route(prompt: str, columns):
+    """
+    Returns {'tool': name, 'args': {...}, 'route': graph route} when the prompt maps
+    unambiguously to one tool, None otherwise.
+    """
+    prompt = normalize(prompt)
+    mentioned, remainder = find_columns(prompt, columns)
+
+    matches = [intent for intent in INTENTS if re.search(rf'\b(?:{intent[2]})\b', remainder)]
+    if len(matches) != 1:
+        return None
+    tool_name, route, keyword, arg_names = matches[0]
+
+    if len(mentioned) != len(arg_names):
+        return None
+
+    # Everything that is not the keyword or a column must be filler
+    leftover = re.sub(rf'\b(?:{keyword})\b', ' ', remainder).split()
+    if any(word not in FILLER_WORDS for word in leftover):
+        return None
+
+    return {'tool': tool_name, 'args': dict(zip(arg_names, mentioned)), 'route': route}
+
+
+class RouterStats:
+    # Requests served by the fast path versus the LLM graph, with their latencies
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'fast_path': 0, 'llm': 0}
+        self.seconds = {'fast_path': 0.0, 'llm': 0.0}
+
+    def record(self, fast_path: bool, seconds: float):
+        path = 'fast_path' if fast_path else 'llm'
+        with self.lock:
+            self.counts[path] += 1
+            self.seconds[path] += seconds
+
+    def stats(self):
+        with self.lock:
+            total = self.counts['fast_path'] + self.counts['llm']
+            avg = {path: self.seconds[path] / self.counts[path] if self.counts[path] else 0.0 for path in self.counts}
+            # Estimated as if every fast path request had taken the average LLM path time
+            saved = self.counts['fast_path'] * (avg['llm'] - avg['fast_path']) if self.counts['llm'] else None
+            return {
+                'fast_path_requests': self.counts['fast_path'],
+                'llm_requests': self.counts['llm'],
+                'fast_path_ratio': self.counts['fast_path'] / total if total else 0.0,
+                'avg_fast_path_seconds': avg['fast_path'],
+                'avg_llm_seconds': avg['llm'],
+                'estimated_seconds_saved': saved,
+            }
+
+
+router_stats = RouterStats()
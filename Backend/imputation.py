@@ -0,0 +1,75 @@
+import warnings
+import numpy as np
+from sklearn.impute import KNNImputer
+from sklearn.neighbors import NearestNeighbors
+import config
+
+
+def knn_impute(frame, columns, n_neighbors=5, group_columns=None, time_column=None, time_window=None,
+               exact_max_rows=config.KNN_EXACT_MAX_ROWS, max_donors=config.KNN_MAX_DONORS,
+               chunk_rows=config.KNN_CHUNK_ROWS, seed=0):
+    """
+    KNN imputation of `columns` that scales to millions of rows. Returns the imputed
+    values as a float array with one column per entry of `columns`.
+
+    Small tables use sklearn's exact KNNImputer. Larger ones are imputed column by
+    column: the donors (rows where the column is known) are sampled down to
+    max_donors, indexed in a kd/ball tree over the other columns, and the rows to
+    impute query it in chunks of chunk_rows. Neighbours can be restricted to rows of
+    the same group (group_columns) and/or time window (time_column bucketed by the
+    pandas period alias time_window, e.g. 'M' or 'W'); rows left without donors in
+    their group fall back to the whole table.
+    """
+    values = frame[columns].astype('float64').to_numpy()
+    keys = [frame[column] for column in group_columns or []]
+    if time_column and time_window:
+        keys.append(frame[time_column].dt.to_period(time_window))
+
+    if not keys and len(values) <= exact_max_rows:
+        return KNNImputer(n_neighbors=n_neighbors, keep_empty_features=True).fit_transform(values)
+
+    rng = np.random.default_rng(seed)
+    result = values.copy()
+    if keys:
+        for positions in frame.groupby(keys, sort=False, dropna=False).indices.values():
+            result[positions] = impute_block(values[positions], n_neighbors, max_donors, chunk_rows, rng)
+    # Whole table pass, for the rows a group could not impute
+    return impute_block(result, n_neighbors, max_donors, chunk_rows, rng)
+
+
+def impute_block(block, n_neighbors, max_donors, chunk_rows, rng):
+    missing = np.isnan(block)
+    if not missing.any():
+        return block
+    filled = block.copy()
+
+    # Distances are computed on mean-filled features, an approximation of the
+    # nan-euclidean distance of KNNImputer
+    with warnings.catch_warnings():
+        # Columns without any value get a 0 mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nan_to_num(np.nanmean(block, axis=0))
+    features = np.where(missing, means, block)
+
+    for j in range(block.shape[1]):
+        receivers = np.flatnonzero(missing[:, j])
+        donors = np.flatnonzero(~missing[:, j])
+        if len(receivers) == 0 or len(donors) == 0:
+            continue
+        if len(donors) > max_donors:
+            donors = rng.choice(donors, max_donors, replace=False)
+
+        other = [i for i in range(block.shape[1]) if i != j]
+        if not other:
+            # No other column to measure distances on, same as KNNImputer: use the mean
+            filled[receivers, j] = block[donors, j].mean()
+            continue
+
+        k = min(n_neighbors, len(donors))
+        algorithm = 'kd_tree' if len(other) <= 20 else 'ball_tree'
+        index = NearestNeighbors(n_neighbors=k, algorithm=algorithm).fit(features[np.ix_(donors, other)])
+        for start in range(0, len(receivers), chunk_rows):
+            chunk = receivers[start:start + chunk_rows]
+            _, neighbours = index.kneighbors(features[np.ix_(chunk, other)])
+            filled[chunk, j] = block[donors[neighbours], j].mean(axis=1)
+    return filled
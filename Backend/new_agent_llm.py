@@ -1,23 +1,179 @@
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph import StateGraph, END
+import json
 import operator
+import threading
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
-from typing import TypedDict, Annotated
-from IPython.display import Image, display
+from typing import TypedDict, Annotated, Optional
+from langchain_core.runnables import RunnableConfig
 from langchain_core.runnables.graph import CurveStyle, MermaidDrawMethod, NodeStyles
+import config as app_config
+from fast_router import match_fast_route
+from prompt_context import schema_summary, column_names
+
+def add_messages_window(left: list, right: list) -> list:
+    # Appends the new messages and keeps the last MAX_HISTORY_MESSAGES, the state stored
+    # in every checkpoint does not grow with the length of the conversation
+    return (left + right)[-app_config.MAX_HISTORY_MESSAGES:]
 
 class AgentState(TypedDict):
-    messages: Annotated[list[AnyMessage], operator.add]
+    messages: Annotated[list[AnyMessage], add_messages_window]
+    # Set by the structured router, read by the edges instead of classifying again
+    route: Optional[str]
+    column: Optional[str]
+    # Tool call resolved by the fast path router
+    fast_call: Optional[dict]
+
+# Leaf nodes the structured router can choose from
+ROUTES = ['data_modification', 'process_na_values', 'create_analysis', 'create_graphics', 'help_user', 'prompt_unrelated']
+
+ROUTER_INSTRUCTION = """You are an expert in data science. Classify the user's prompt into exactly one route:
+
+data_modification: filter rows (numeric, string or date conditions, date ranges), drop columns or operate with dates.
+process_na_values: impute or fill missing (NA) values (mean, median, KNN, mode, placeholder, forward/backward fill, interpolation).
+create_analysis: descriptive statistics, correlations, value counts, outliers, trends or a report of missing values.
+create_graphics: bar charts, histograms, line charts or scatter plots.
+help_user: the user asks for help or for the functionalities of the application.
+prompt_unrelated: the prompt is unrelated to data analysis or to the application.
+
+For data_modification also return the exact name of the column the user wants to modify, taken from the list of columns. Otherwise return null.
+Respond only with a JSON object like {"route": "create_analysis", "column": null}."""
+
+# Instructions of the nodes. They are constant so every turn starts with the same
+# prefix and the model server reuses its cache; the dataset context goes after them.
+HIGH_LEVEL_INSTRUCTION = """You are an expert in data science. Your task is to evaluate the user's prompt and classify it into one of the following three categories:
+A: The user wants to modify or analyze data.
+B: The user is asking for help with the application (e.g., asking for guidance or functions).
+C: The user's prompt is unrelated to the subject or the application's tasks.
+Output only the letter (A, B, or C) corresponding to the user's intention. Do not provide any additional explanation or output."""
+
+DATA_RELATED_INSTRUCTION = """You are an expert in data science. The user's prompt has been classified as data-related. Now, determine the specific task:
+
+A: The user wants to modify or filter the data. This includes:
+   - Filtering rows based on numeric or categorical values (e.g., "all values above 80 in column X", "rows where column Y equals 'yes'").
+   - Modifying or removing columns (e.g., dropping a column, filtering by date, creating a date range).
+   - Manipulating dates (e.g., getting the current date or performing date operations like adding/subtracting years).
+B: The user wants to process missing (NA) values in the dataset. This includes:
+   - Imputing missing values using methods like mean, median, KNN, or mode imputation.
+   - Replacing missing values with placeholders, forward/backward filling, or interpolation.
+C: The user wants to perform analysis on the data. This includes:
+   - Generating descriptive statistics, checking for correlations, and finding value counts.
+   - Detecting outliers, analyzing trends, or viewing summary information on missing values.
+D: The user wants to create a graphical representation of the data. This includes:
+   - Creating visualizations such as bar charts, histograms, line charts, or scatter plots.
+
+Output only the letter (A, B, C, or D) corresponding to the user's intention. Do not provide any additional explanation or output.
+"""
+
+COLUMN_INSTRUCTION = """Identify and return only the exact column name the user wants to modify from their input, with no extra text or quotes. Focus on phrases like 'column,' 'field,' or 'modify.'
+
+**Examples:**
+- User: 'In the column date, filter for 2020.'
+  - Output: date
+- User: 'Modify the sales column by removing low values.'
+  - Output: sales
+
+Respond with just the column name."""
+
+DATA_MODIFICATION_INSTRUCTION = """You are now in the data modification phase. You have access to the column name and its data type (dtype) from the user's input, allowing you to choose the most appropriate tool and provide accurate arguments. The available tools are:
+
+1. tool_data_range(column_name: str, start_date: str, end_date: str): Extracts a date range in the dataframe. Use this if the dtype is 'datetime'.
+2. tool_get_current_date(): Returns the current date in dd-mm-yyyy format.
+3. tool_operation_date(date_str: str, operation: str, years: int): Adds or subtracts years from a date. Use this if the input is a specific date string.
+4. tool_filter_string(column_name: str, string_filter: str, include: bool): Filters rows based on whether a column value starts with or equals a given string. Use this if the dtype is 'string' or 'object'. 'include' determines if it includes or excludes the matching rows.
+5. tool_filter_numeric(column_name: str, comparison: str, value: float): Filters rows in a numeric column based on comparison operators ('>', '<', '=', '>=', '<='). Use this if the dtype is numeric.
+6. tool_drop_column(column_name: str): Drops a specified column from the dataframe.
+7. tool_filter_date(column_name: str, date_part: str, value: int): Filters rows by year, month, or day in a date column based on the specified value. Use this if the dtype is 'datetime'.
+
+Based on the column name, dtype, and the user’s prompt, choose the appropriate tool and provide only the function call with the correct arguments, without any additional explanation."""
+
+PROCESS_NA_INSTRUCTION = """You are now in the part of processing missing (NA) values. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:
+
+1. tool_impute_mean_median(column_name: str, strategy: str = 'mean'): Impute missing values in a numerical column using mean or median.
+2. tool_knn_imputation(columns: list[str], n_neighbors: int = 5, group_column: str = None, time_column: str = None, time_window: str = None): Perform K-Nearest Neighbors imputation for numerical columns. Pass group_column, or time_column with a time_window ('D', 'W', 'M' or 'Y'), only if the user wants the neighbours taken from the same group or period.
+3. tool_interpolation(column_name: str, method: str = 'linear'): Perform linear or polynomial interpolation on a time-series column.
+4. tool_impute_mode(column_name: str): Impute missing values in a categorical column using the most frequent value (mode).
+5. tool_impute_placeholder(column_name: str, placeholder: str = 'Unknown'): Impute missing values in a categorical column with a placeholder value.
+6. tool_forward_backward_fill(column_name: str, direction: str = 'forward'): Perform forward or backward fill for a datetime column.
+
+7. tool_missing_values(): Reports the missing values of all columns in the dataset.
+
+Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation."""
+
+DATA_ANALYSIS_INSTRUCTION = """You are now in the part of data analysis. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:
+
+1. tool_descriptive_statistics(column_name: str): Provide basic descriptive statistics for a given numeric column.
+2. tool_correlation_matrix(column_name: str): Calculate and display the correlation matrix for numeric columns.
+3. tool_missing_values(): Analyze and report the percentage of missing values per column.
+4. tool_value_counts(column_name: str): Provide the frequency distribution of a given column.
+5. tool_outlier_detection(column_name: str): Detect outliers in a numeric column using the IQR method.
+6. tool_trend_analysis(column_name: str, window: int = 5): Calculate the moving average for trend analysis on a time-series column.
+
+Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation."""
+
+DATA_GRAPHICS_INSTRUCTION = """You are now in the part of creating graphical visualizations. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:
+
+1. tool_bar_chart(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a bar chart with column_name1 on the x-axis and column_name2 as the height of the bars.
+2. tool_histogram(column_name: str, color1: str = 'red'): Create a histogram for column_name.
+3. tool_line_chart(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a line chart with column_name1 on the x-axis and column_name2 on the y-axis.
+4. tool_scatter_plot(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a scatter plot with column_name1 on the x-axis and column_name2 on the y-axis.
+
+Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation."""
+
+HELP_INSTRUCTION = """You are an expert in data science and your task is to explain the bot's capabilities based on the user's prompt. If the user is asking for help or details about the bot's functionalities, respond by listing the available options in a clear and concise manner. Here are the functionalities you can explain to the user:
+1. **Data Modification**: Filter or modify data (e.g., filter by date, string, numeric values, or drop columns).
+2. **Handling Missing Values**: Impute or process missing data using techniques like mean, median, KNN imputation, forward/backward fill, mode imputation, or interpolation.
+3. **Data Analysis**: Perform statistical analyses, calculate correlation matrices, detect outliers, count unique values, or conduct trend analysis.
+4. **Data Visualization**: Create visual representations like bar charts, histograms, line charts, or scatter plots.
+Provide this information in a concise manner and ask the user what they would like assistance with."""
+
+
+class LLMStats:
+    # Prompt and generation tokens of the LLM calls with their time, per graph node.
+    # Ollama reports the durations in nanoseconds; a prompt whose prefix is cached
+    # shows a short prompt evaluation for its token count.
+    FIELDS = ['prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}
+
+    def record(self, node: str, metadata: dict):
+        values = {field: metadata.get(field) or 0 for field in self.FIELDS}
+        with self.lock:
+            totals = self.nodes.setdefault(node, dict.fromkeys(['calls'] + self.FIELDS, 0))
+            totals['calls'] += 1
+            for field in self.FIELDS:
+                totals[field] += values[field]
+        return values
+
+    def stats(self):
+        with self.lock:
+            return {
+                node: {
+                    'calls': totals['calls'],
+                    'avg_prompt_tokens': totals['prompt_eval_count'] / totals['calls'],
+                    'avg_prompt_seconds': totals['prompt_eval_duration'] / totals['calls'] / 1e9,
+                    'avg_output_tokens': totals['eval_count'] / totals['calls'],
+                    'avg_output_seconds': totals['eval_duration'] / totals['calls'] / 1e9,
+                }
+                for node, totals in self.nodes.items()
+            }
+
+
+llm_stats = LLMStats()
 
 class Agent:
-    def __init__(self, model,business_description, data_extractor,data_modifications_tools,process_na_value_tools, data_analysis_tools,data_graphics_tools,system="", checkpointer=None):
-        self.data_extractor = data_extractor
+    # One Agent (compiled graph and bound models) is shared by every session.
+    # The user's DataExtractor travels in config['configurable']['data_extractor'].
+    def __init__(self, model,business_description,data_modifications_tools,process_na_value_tools, data_analysis_tools,data_graphics_tools,system="", checkpointer=None, routing_mode=app_config.ROUTING_MODE, fast_path=app_config.FAST_PATH_ROUTER):
         print(business_description)
         self.business_description = business_description
         self.system = ''
         self.na_values = {}
       
         self.checkpointer = checkpointer
+        self.routing_mode = routing_mode
+        self.use_fast_path = fast_path
        
         ############ GRAPH ########
         graph = StateGraph(AgentState)
@@ -25,7 +181,8 @@ class Agent:
         graph.add_conditional_edges('start_node',self.high_level_intention, {
                                     'data_related': 'data_related_intention',  # If the task is data-related
                                     'help_user': 'help_user',  # If the user asks for help
-                                    'prompt_unrelated': 'prompt_unrelated'  # If the prompt is unrelated
+                                    'prompt_unrelated': 'prompt_unrelated',  # If the prompt is unrelated
+                                    'fast_path': 'fast_path'  # If the fast path router resolved the tool
 })
         graph.add_node('data_related_intention', self.data_related_intention_node)
         graph.add_conditional_edges('data_related_intention',self.data_related_intention, {
@@ -40,6 +197,7 @@ class Agent:
         graph.add_node('create_graphics', self.create_data_graphics)
         graph.add_node('help_user', self.help_user)
         graph.add_node('prompt_unrelated',self.prompt_unrelated)
+        graph.add_node('fast_path', self.fast_path)
 
         graph.add_edge('data_modification',END)
         graph.add_edge('process_na_values', END)
@@ -47,23 +205,14 @@ class Agent:
         graph.add_edge('create_graphics', END)
         graph.add_edge('help_user',END)
         graph.add_edge('prompt_unrelated',END)
+        graph.add_edge('fast_path', END)
         
 
 
         graph.set_entry_point("start_node")
         
         self.graph = graph.compile(checkpointer=checkpointer )
-        graph_png = self.graph.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.API)
-
-        with open("graph.png", "wb") as f:
-            f.write(graph_png)
-
-        print("El grafo se ha guardado como 'graph.png'")
-
 
-        self.tools = self.data_extractor.tools
-       
-        
         self.data_modification_model = model.bind_tools(data_modifications_tools)
         self.process_na_value_tools_model = model.bind_tools(process_na_value_tools)
         self.data_analysis_tools_model = model.bind_tools(data_analysis_tools)
@@ -71,132 +220,156 @@ class Agent:
 
         # Model without tools
         self.model_no_tools =  model
+        # Model answering in JSON, used by the structured router
+        self.router_model = model.bind(format='json')
 
         
-    def execute_tools(self,model_response):
+    def draw_graph(self, path="graph.png", draw_method=MermaidDrawMethod.API):
+        # Debug only: the API method renders through mermaid.ink and needs network access
+        if path.endswith(".png"):
+            content = self.graph.get_graph().draw_mermaid_png(draw_method=draw_method)
+        else:
+            content = self.graph.get_graph().draw_mermaid().encode()
+
+        with open(path, "wb") as f:
+            f.write(content)
+
+        print(f"El grafo se ha guardado como '{path}'")
+
+    def forget_thread(self, thread_id):
+        # Drop the checkpoints of a thread, from the conversation store or an in-memory checkpointer
+        if hasattr(self.checkpointer, 'delete_thread'):
+            self.checkpointer.delete_thread(thread_id)
+        storage = getattr(self.checkpointer, 'storage', None)
+        if storage is not None:
+            storage.pop(thread_id, None)
+
+    def end_turn(self, thread_id):
+        # Only the last checkpoints of the thread are needed to continue the conversation
+        if hasattr(self.checkpointer, 'prune'):
+            self.checkpointer.prune(thread_id)
+
+    def get_data_extractor(self, config: RunnableConfig):
+        return config['configurable']['data_extractor']
+
+    def user_message(self, state: AgentState):
+        # The text of the last message, without the repr of the message object
+        return HumanMessage(content=state['messages'][-1].content)
+
+    def call_model(self, node, model, messages, config: RunnableConfig = None):
+        # Every LLM call goes through here to log its prompt size and prefill time
+        response = model.invoke(messages, config=config)
+        metrics = llm_stats.record(node, getattr(response, 'response_metadata', None) or {})
+        print(f"LLM {node}: {metrics['prompt_eval_count']} prompt tokens in {metrics['prompt_eval_duration'] / 1e9:.3f}s, "
+              f"{metrics['eval_count']} output tokens in {metrics['eval_duration'] / 1e9:.3f}s")
+        return response
+
+    def execute_tools(self,model_response, data_extractor, config: RunnableConfig = None):
       
         tool_calls = model_response.tool_calls
         for t in tool_calls:
             tool_name = t['name']
             tool_args = t['args']
-            tool = self.tools[tool_name]
-            result = tool.invoke(tool_args)
+            tool = data_extractor.tools[tool_name]
+            result = tool.invoke(tool_args, config=config)
             
         return result
 
     ##################### NODES ############################
 
-    def start_point(self,state: AgentState):
+    def start_point(self,state: AgentState, config: RunnableConfig):
         print("node_start_point")
-        pass
+        data_extractor = self.get_data_extractor(config)
+
+        # Obvious prompts go straight to their tool without calling the LLM
+        if self.use_fast_path:
+            fast_call = match_fast_route(state['messages'][-1].content, data_extractor.columns)
+            if fast_call:
+                print("Fast path:", fast_call)
+                return {'route': 'fast_path', 'column': None, 'fast_call': fast_call}
+
+        if self.routing_mode != 'structured':
+            return {'route': None, 'column': None, 'fast_call': None}
+
+        route, column = self.structured_route(state, data_extractor, config)
+        return {'route': route, 'column': column, 'fast_call': None}
+
+    def fast_path(self, state: AgentState, config: RunnableConfig):
+        print('node_fast_path')
+        data_extractor = self.get_data_extractor(config)
+        fast_call = state['fast_call']
+        result = data_extractor.tools[fast_call['tool']].invoke(fast_call['args'], config=config)
+        message = SystemMessage(content=str(result))
+        # Report the route of the tool, callers use it to tell analyses from modifications
+        return {'messages': [message], 'route': fast_call['route']}
 
     def data_related_intention_node(self,state: AgentState):
         print('node_data_related_intention')
         pass
 
 
-    def data_modification(self, state: AgentState):
+    def data_modification(self, state: AgentState, config: RunnableConfig):
+        data_extractor = self.get_data_extractor(config)
         print('node_data_modification')
-        user_prompt = state['messages'][-1]
-        user_prompt = HumanMessage(content=str(user_prompt))
-        column_instruction = SystemMessage(content="Identify and return only the exact column name the user wants to modify from their input, with no extra text or quotes. Focus on phrases like 'column,' 'field,' or 'modify.'\n\n\
-**Examples:**\n\
-- User: 'In the column date, filter for 2020.'\n\
-  - Output: date\n\
-- User: 'Modify the sales column by removing low values.'\n\
-  - Output: sales\n\n\
-Respond with just the column name.")
-
-        column_response = self.model_no_tools.invoke([column_instruction,user_prompt]).content.strip().split()[-1]
+        user_prompt = self.user_message(state)
+
+        # The structured router already extracted the column
+        column_response = state.get('column')
+        if not column_response:
+            column_response = self.call_model('data_modification_column', self.model_no_tools, [SystemMessage(content=COLUMN_INSTRUCTION), user_prompt], config).content.strip().split()[-1]
      
-        column_type = self.data_extractor.columns[column_response]['dtype']
-    
-        instruction = SystemMessage(content=f"You are now in the data modification phase. You have access to the column name and its data type (dtype) from the user's input, allowing you to choose the most appropriate tool and provide accurate arguments. The available tools are:\n\n\
-1. tool_data_range(column_name: str, start_date: str, end_date: str): Extracts a date range in the dataframe. Use this if the dtype is 'datetime'.\n\
-2. tool_get_current_date(): Returns the current date in dd-mm-yyyy format.\n\
-3. tool_operation_date(date_str: str, operation: str, years: int): Adds or subtracts years from a date. Use this if the input is a specific date string.\n\
-4. tool_filter_string(column_name: str, string_filter: str, include: bool): Filters rows based on whether a column value starts with or equals a given string. Use this if the dtype is 'string' or 'object'. 'include' determines if it includes or excludes the matching rows.\n\
-5. tool_filter_numeric(column_name: str, comparison: str, value: float): Filters rows in a numeric column based on comparison operators ('>', '<', '=', '>=', '<='). Use this if the dtype is numeric.\n\
-6. tool_drop_column(column_name: str): Drops a specified column from the dataframe.\n\
-7. tool_filter_date(column_name: str, date_part: str, value: int): Filters rows by year, month, or day in a date column based on the specified value. Use this if the dtype is 'datetime'.\n\n\
-Based on the column name, dtype, and the user’s prompt, choose the appropriate tool and provide only the function call with the correct arguments, without any additional explanation.\n\n\
-The column name is : {column_response} and his dtype is: {column_type}")
+        column_type = data_extractor.columns[column_response]['dtype']
+        context = SystemMessage(content=f"The column name is : {column_response} and his dtype is: {column_type}")
 
-      
-        model_response = self.data_modification_model.invoke([instruction,user_prompt])
+        model_response = self.call_model('data_modification', self.data_modification_model, [SystemMessage(content=DATA_MODIFICATION_INSTRUCTION), context, user_prompt], config)
         
         
         if model_response.tool_calls:
            
-            result = self.execute_tools(model_response)
+            result = self.execute_tools(model_response, data_extractor, config)
         message = SystemMessage(content=str(result))
         return {'messages': [message]}
 
     
-    def process_na_values(self, state: AgentState):
+    def process_na_values(self, state: AgentState, config: RunnableConfig):
+        data_extractor = self.get_data_extractor(config)
         print('node_process_na_values')
-        user_prompt = HumanMessage(content=str(state['messages'][-1]))
-        instruction = SystemMessage(content=f"You are now in the part of processing missing (NA) values. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:\n\n\
-1. tool_impute_mean_median(column_name: str, strategy: str = 'mean'): Impute missing values in a numerical column using mean or median.\n\
-2. tool_knn_imputation(columns: list[str], n_neighbors: int = 5): Perform K-Nearest Neighbors imputation for numerical columns.\n\
-3. tool_interpolation(column_name: str, method: str = 'linear'): Perform linear or polynomial interpolation on a time-series column.\n\
-4. tool_impute_mode(column_name: str): Impute missing values in a categorical column using the most frequent value (mode).\n\
-5. tool_impute_placeholder(column_name: str, placeholder: str = 'Unknown'): Impute missing values in a categorical column with a placeholder value.\n\
-6. tool_forward_backward_fill(column_name: str, direction: str = 'forward'): Perform forward or backward fill for a datetime column.\n\n\
-7. tool_missing_values(): Reports the missing values of all columns in the dataset.\n\n\
-Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation.\n\
-The information about the na values is: {self.data_extractor.columns}.\n\
-USER MESSAGE: {user_prompt}")
-        model_response = self.process_na_value_tools_model.invoke([instruction,user_prompt])
+        user_prompt = self.user_message(state)
+        # Only the columns named in the prompt, or the ones with missing values
+        context = SystemMessage(content=schema_summary(data_extractor.columns, user_prompt.content, na_only=True))
+        model_response = self.call_model('process_na_values', self.process_na_value_tools_model, [SystemMessage(content=PROCESS_NA_INSTRUCTION), context, user_prompt], config)
         
         if model_response.tool_calls:
            
-            result = self.execute_tools(model_response)
+            result = self.execute_tools(model_response, data_extractor, config)
         message = SystemMessage(content=str(result))
         return {'messages': [message]}
 
         
-    def create_data_analysis(self, state: AgentState):
+    def create_data_analysis(self, state: AgentState, config: RunnableConfig):
+        data_extractor = self.get_data_extractor(config)
         print('node_create_data_analysis')
-        user_prompt = state['messages'][-1]
-        user_prompt = HumanMessage(content=str(user_prompt))
-        instruction = SystemMessage(content=f"You are now in the part of data analysis. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:\n\n\
-1. tool_descriptive_statistics(column_name: str): Provide basic descriptive statistics for a given numeric column.\n\
-2. tool_correlation_matrix(column_name: str): Calculate and display the correlation matrix for numeric columns.\n\
-3. tool_missing_values(): Analyze and report the percentage of missing values per column.\n\
-4. tool_value_counts(column_name: str): Provide the frequency distribution of a given column.\n\
-5. tool_outlier_detection(column_name: str): Detect outliers in a numeric column using the IQR method.\n\
-6. tool_trend_analysis(column_name: str, window: int = 5): Calculate the moving average for trend analysis on a time-series column.\n\n\
-Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation.\n\
-USER MESSAGE: {user_prompt}")
-
-           
-        model_response = self.data_analysis_tools_model.invoke([instruction,user_prompt])
+        user_prompt = self.user_message(state)
+        model_response = self.call_model('create_analysis', self.data_analysis_tools_model, [SystemMessage(content=DATA_ANALYSIS_INSTRUCTION), user_prompt], config)
       
         
         if model_response.tool_calls:
            
-            result = self.execute_tools(model_response)
+            result = self.execute_tools(model_response, data_extractor, config)
         message = SystemMessage(content=str(result))
         return {'messages': [message]}
     
     
-    def create_data_graphics(self, state: AgentState):
+    def create_data_graphics(self, state: AgentState, config: RunnableConfig):
+        data_extractor = self.get_data_extractor(config)
         print('node_create_data_graphics')
-        user_prompt = state['messages'][-1]
-        user_prompt = HumanMessage(content=str(user_prompt))
-        instruction = SystemMessage(content=f"You are now in the part of creating graphical visualizations. Your task is to choose the correct tool based on the user's input and pass the correct arguments. The available tools are:\n\n\
-1. tool_bar_chart(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a bar chart with column_name1 on the x-axis and column_name2 as the height of the bars.\n\
-2. tool_histogram(column_name: str, color1: str = 'red'): Create a histogram for column_name.\n\
-3. tool_line_chart(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a line chart with column_name1 on the x-axis and column_name2 on the y-axis.\n\
-4. tool_scatter_plot(column_name1: str, column_name2: str, color1: str = 'red', color2: str = 'blue'): Create a scatter plot with column_name1 on the x-axis and column_name2 on the y-axis.\n\n\
-Based on the user's prompt, you must choose the appropriate tool and provide the correct arguments. Output only the function call with the correct arguments, without any extra explanation.")
-        model_response = self.data_graphics_tools_model.invoke([instruction,user_prompt])
+        user_prompt = self.user_message(state)
+        model_response = self.call_model('create_graphics', self.data_graphics_tools_model, [SystemMessage(content=DATA_GRAPHICS_INSTRUCTION), user_prompt], config)
         
     
         if model_response.tool_calls:
            
-            result = self.execute_tools(model_response)
+            result = self.execute_tools(model_response, data_extractor, config)
         message = SystemMessage(content=result)
         
         
@@ -208,38 +381,44 @@ Based on the user's prompt, you must choose the appropriate tool and provide the
         message = SystemMessage(content='It seems like your request is unrelated to the tasks I can assist with. I specialize in data analysis, such as modifying data, handling missing values, performing analysis, and creating visualizations. How can I help you with your data?') 
         return {'messages': [message]}
     
-    def help_user(self, state:AgentState):
+    def help_user(self, state:AgentState, config: RunnableConfig):
         print('node_help_user')
-        user_prompt = state['messages'][-1]
-        instruction = SystemMessage(content=f"You are an expert in data science and your task is to explain the bot's capabilities based on the user's prompt. \
-                If the user is asking for help or details about the bot's functionalities, respond by listing the available options in a clear and concise manner. \
-                Here are the functionalities you can explain to the user:\n\
-                1. **Data Modification**: Filter or modify data (e.g., filter by date, string, numeric values, or drop columns).\n\
-                2. **Handling Missing Values**: Impute or process missing data using techniques like mean, median, KNN imputation, forward/backward fill, mode imputation, or interpolation.\n\
-                3. **Data Analysis**: Perform statistical analyses, calculate correlation matrices, detect outliers, count unique values, or conduct trend analysis.\n\
-                4. **Data Visualization**: Create visual representations like bar charts, histograms, line charts, or scatter plots.\n\
-                Provide this information in a concise manner and ask the user what they would like assistance with."
-)
-        model_response = self.model_no_tools.invoke([instruction,user_prompt])
+        user_prompt = self.user_message(state)
+        model_response = self.call_model('help_user', self.model_no_tools, [SystemMessage(content=HELP_INSTRUCTION), user_prompt], config)
         message = SystemMessage(content=model_response.content)
         return {'messages': [message]}
         
 
     
   ###################### EDGES #########################
-    def high_level_intention(self, state: AgentState):
+    def structured_route(self, state: AgentState, data_extractor, config: RunnableConfig):
+        # Single JSON call resolving the route and, for modifications, the column.
+        # Returns (None, None) when the answer is unusable so the cascade takes over.
+        user_prompt = self.user_message(state)
+        columns = SystemMessage(content=column_names(data_extractor.columns, user_prompt.content))
+        model_response = self.call_model('structured_route', self.router_model, [SystemMessage(content=ROUTER_INSTRUCTION), columns, user_prompt], config).content
+
+        try:
+            decision = json.loads(model_response)
+        except json.JSONDecodeError:
+            decision = {}
+        route = decision.get('route') if isinstance(decision, dict) else None
+        column = decision.get('column') if isinstance(decision, dict) else None
+
+        print("Structured route:", route, column)
+        if route not in ROUTES:
+            return None, None
+        if column not in data_extractor.columns:
+            column = None
+        return route, column
+
+    def high_level_intention(self, state: AgentState, config: RunnableConfig):
         print('edge_high_level_intention')
-        user_prompt = state['messages'][-1]
-        user_prompt = HumanMessage(content=str(user_prompt))
-        
-        # Instruction to categorize the user prompt
-        instruction = SystemMessage(content=f"You are an expert in data science. Your task is to evaluate the user's prompt and classify it into one of the following three categories:\n\
-        A: The user wants to modify or analyze data.\n\
-        B: The user is asking for help with the application (e.g., asking for guidance or functions).\n\
-        C: The user's prompt is unrelated to the subject or the application's tasks.\n\
-        Output only the letter (A, B, or C) corresponding to the user's intention. Do not provide any additional explanation or output.")
-        
-        model_response = self.model_no_tools.invoke([instruction, user_prompt]).content.strip()
+        if state.get('route'):
+            return state['route'] if state['route'] in ('help_user', 'prompt_unrelated', 'fast_path') else 'data_related'
+
+        user_prompt = self.user_message(state)
+        model_response = self.call_model('high_level_intention', self.model_no_tools, [SystemMessage(content=HIGH_LEVEL_INSTRUCTION), user_prompt], config).content.strip()
         
         print("High-level intention:", model_response)
         
@@ -252,30 +431,13 @@ Based on the user's prompt, you must choose the appropriate tool and provide the
         else:
             return 'default'
         
-    def data_related_intention(self, state: AgentState):
+    def data_related_intention(self, state: AgentState, config: RunnableConfig):
         print('edge_data_related_intention')
-        user_prompt = state['messages'][-1]
-        user_prompt = HumanMessage(content=str(user_prompt))
-        
-        # Instruction to classify the data-related task
-        instruction = SystemMessage(content=f"""You are an expert in data science. The user's prompt has been classified as data-related. Now, determine the specific task:
-
-A: The user wants to modify or filter the data. This includes:
-   - Filtering rows based on numeric or categorical values (e.g., "all values above 80 in column X", "rows where column Y equals 'yes'").
-   - Modifying or removing columns (e.g., dropping a column, filtering by date, creating a date range).
-   - Manipulating dates (e.g., getting the current date or performing date operations like adding/subtracting years).
-B: The user wants to process missing (NA) values in the dataset. This includes:
-   - Imputing missing values using methods like mean, median, KNN, or mode imputation.
-   - Replacing missing values with placeholders, forward/backward filling, or interpolation.
-C: The user wants to perform analysis on the data. This includes:
-   - Generating descriptive statistics, checking for correlations, and finding value counts.
-   - Detecting outliers, analyzing trends, or viewing summary information on missing values.
-D: The user wants to create a graphical representation of the data. This includes:
-   - Creating visualizations such as bar charts, histograms, line charts, or scatter plots.
+        if state.get('route'):
+            return state['route']
 
-Output only the letter (A, B, C, or D) corresponding to the user's intention. Do not provide any additional explanation or output.
-""")
-        model_response = self.model_no_tools.invoke([instruction, user_prompt]).content.strip()
+        user_prompt = self.user_message(state)
+        model_response = self.call_model('data_related_intention', self.model_no_tools, [SystemMessage(content=DATA_RELATED_INSTRUCTION), user_prompt], config).content.strip()
         
         print("Data-related intention:", model_response)
         
@@ -288,4 +450,28 @@ Output only the letter (A, B, C, or D) corresponding to the user's intention. Do
         elif model_response == 'D':
             return 'create_graphics'
         else:
-            return 'default'
\ No newline at end of file
+            return 'default'
+
+
+if __name__ == "__main__":
+    # Debug command to render the agent graph:
+    #   python new_agent_llm.py --output graph.png   (mermaid.ink, needs network)
+    #   python new_agent_llm.py --output graph.mmd   (mermaid source, offline)
+    import argparse
+    from langchain_ollama import ChatOllama
+    from data_extractor import DataExtractor
+
+    parser = argparse.ArgumentParser(description="Render the agent graph")
+    parser.add_argument("--output", default="graph.png")
+    args = parser.parse_args()
+
+    tool_schemas = DataExtractor.tool_schemas()
+    agent = Agent(
+        model=ChatOllama(model='llama3.1:latest', temperature=0),
+        business_description="business_description",
+        data_modifications_tools=tool_schemas.data_modifications_tools,
+        process_na_value_tools=tool_schemas.process_na_values_tools,
+        data_analysis_tools=tool_schemas.data_analysis_tools,
+        data_graphics_tools=tool_schemas.data_graphics_tools,
+    )
+    agent.draw_graph(args.output)
@@ -0,0 +1,47 @@
+from fast_router import find_columns, normalize
+import config
+
+# Dataset context given to the LLM nodes. The instructions of the nodes are constant
+# strings so the model server can reuse their prefix between turns, the per-turn context
+# is this short summary sent after them, with only the columns that matter.
+
+
+def column_line(name, info):
+    line = f"{name}: {info['dtype']}"
+    if info.get('na_count'):
+        line += f", {info['na_count']} NA"
+    return line
+
+
+def relevant_columns(columns: dict, prompt: str, na_only=False):
+    # The columns the prompt names, otherwise every column (with na_only, only the
+    # columns with missing values)
+    mentioned, _ = find_columns(normalize(prompt), columns)
+    if mentioned:
+        return list(dict.fromkeys(mentioned))
+    if na_only:
+        return [name for name, info in columns.items() if info.get('na_count')]
+    return list(columns)
+
+
+def truncated(lines, total, max_columns):
+    if total > max_columns:
+        lines.append(f"... and {total - max_columns} more columns")
+    return lines
+
+
+def schema_summary(columns: dict, prompt: str, na_only=False, max_columns=config.PROMPT_MAX_COLUMNS):
+    """
+    One line per relevant column with its dtype and NA count, at most max_columns.
+    """
+    names = relevant_columns(columns, prompt, na_only)
+    lines = truncated([column_line(name, columns[name]) for name in names[:max_columns]], len(names), max_columns)
+    if not lines:
+        lines.append("No column has missing values")
+    return "Columns (name: dtype, missing values):\n" + "\n".join(lines)
+
+
+def column_names(columns: dict, prompt: str, max_columns=config.PROMPT_MAX_COLUMNS):
+    # Names only, for the router: the relevant columns, at most max_columns
+    names = relevant_columns(columns, prompt)
+    return "Columns: " + ", ".join(truncated(names[:max_columns], len(names), max_columns))
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+import config
+
+# Routes whose answer only depends on the prompt and the data, never on a modification
+CACHEABLE_ROUTES = {'create_analysis', 'create_graphics', 'help_user'}
+
+
+class ResponseCache:
+    """
+    LRU cache of chat answers keyed on (user, normalized prompt, data fingerprint).
+
+    A user's entries are dropped as soon as a request arrives with a different
+    fingerprint, so any tool that changes the data invalidates them without
+    the tools having to know about the cache.
+    """
+
+    def __init__(self, max_entries=config.RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.fingerprints = {}
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        # Only case and spacing: verbs and operators ('plot' vs 'describe', '>' vs '<')
+        # change the answer, prompts differing in them never share an entry
+        return ' '.join(prompt.lower().split())
+
+    def get(self, user_id, prompt, fingerprint):
+        key = (user_id, self.normalize_prompt(prompt))
+        with self.lock:
+            self._check_fingerprint(user_id, fingerprint)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self.entries[key]
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, user_id, prompt, fingerprint, response):
+        key = (user_id, self.normalize_prompt(prompt))
+        with self.lock:
+            self._check_fingerprint(user_id, fingerprint)
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self._invalidate(user_id)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'entries': len(self.entries),
+                'hit_rate': self.counters['hits'] / lookups if lookups else 0.0,
+            }
+
+    def _check_fingerprint(self, user_id, fingerprint):
+        if self.fingerprints.get(user_id) != fingerprint:
+            self._invalidate(user_id)
+            self.fingerprints[user_id] = fingerprint
+
+    def _invalidate(self, user_id):
+        stale = [key for key in self.entries if key[0] == user_id]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.counters['invalidations'] += 1
+        self.fingerprints.pop(user_id, None)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from data_extractor import DataExtractor
+from dataset_store import DatasetStore
+import config
+
+
+class SessionManager:
+    """
+    Bounded replacement for the module-level session dict.
+
+    Sessions are kept in LRU order. When the datasets held in memory exceed
+    memory_budget, or a session stays idle longer than ttl seconds, the session
+    is spilled: its dataset is already persisted by the DataExtractor and its
+    conversation by the agent's checkpointer, so only the thread id is written
+    next to it. The next
+    request for that user rebuilds the session from disk through session_factory.
+    """
+
+    def __init__(self, session_factory, memory_budget=config.SESSION_MEMORY_BUDGET, ttl=config.SESSION_TTL, on_replace=None, is_busy=None):
+        # session_factory(user_id, data_extractor, thread_id) -> session dict
+        self.session_factory = session_factory
+        # on_replace(thread_id) is called for the session a new upload replaces
+        self.on_replace = on_replace
+        # is_busy(user_id) tells a session in use by a running request, it is never evicted
+        self.is_busy = is_busy or (lambda user_id: False)
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.last_access = {}
+        self.counters = {'hits': 0, 'misses': 0, 'rehydrations': 0, 'evictions': 0, 'expirations': 0}
+        self.lock = threading.RLock()
+
+    def get(self, user_id: str) -> dict:
+        with self.lock:
+            self._expire_idle(exclude=user_id)
+
+            if user_id in self.sessions:
+                self.counters['hits'] += 1
+                self.sessions.move_to_end(user_id)
+            elif DatasetStore(user_id).exists():
+                self.sessions[user_id] = self._rehydrate(user_id)
+                self.counters['rehydrations'] += 1
+            else:
+                # Unknown user: nothing is stored, only put() creates sessions
+                self.counters['misses'] += 1
+                return {}
+
+            self.last_access[user_id] = time.monotonic()
+            self._enforce_budget(exclude=user_id)
+            return self.sessions[user_id]
+
+    def put(self, user_id: str, session: dict):
+        with self.lock:
+            # A fresh upload replaces whatever was in memory or spilled for this user
+            previous = self.sessions.get(user_id) or self._read_meta(user_id)
+            if os.path.exists(self._meta_path(user_id)):
+                os.remove(self._meta_path(user_id))
+            if self.on_replace and previous.get('thread_id') and previous['thread_id'] != session.get('thread_id'):
+                self.on_replace(previous['thread_id'])
+            self.sessions[user_id] = session
+            self.sessions.move_to_end(user_id)
+            self.last_access[user_id] = time.monotonic()
+            self._enforce_budget(exclude=user_id)
+
+    def evict(self, user_id: str):
+        with self.lock:
+            session = self.sessions.pop(user_id, None)
+            self.last_access.pop(user_id, None)
+            if session:
+                self._spill(user_id, session)
+
+    def memory_usage(self) -> int:
+        return sum(self._session_memory(session) for session in self.sessions.values())
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                **self.counters,
+                'active_sessions': len(self.sessions),
+                'memory_bytes': self.memory_usage(),
+                'memory_budget_bytes': self.memory_budget,
+            }
+
+    ###################### INTERNALS #########################
+
+    def _session_memory(self, session):
+        data_extractor = session.get('data_extractor')
+        return data_extractor.memory_usage() if data_extractor else 0
+
+    def _expire_idle(self, exclude):
+        now = time.monotonic()
+        expired = [user_id for user_id, last in self.last_access.items()
+                   if user_id != exclude and now - last > self.ttl and not self.is_busy(user_id)]
+        for user_id in expired:
+            self.evict(user_id)
+            self.counters['expirations'] += 1
+
+    def _enforce_budget(self, exclude):
+        # Evict least recently used sessions until the datasets fit in the budget
+        for user_id in list(self.sessions):
+            if self.memory_usage() <= self.memory_budget:
+                break
+            if user_id == exclude or self.is_busy(user_id):
+                continue
+            self.evict(user_id)
+            self.counters['evictions'] += 1
+
+    def _meta_path(self, user_id):
+        return os.path.join(config.USERS_DATA_FOLDER, user_id, 'session.json')
+
+    def _spill(self, user_id, session):
+        data_extractor = session.get('data_extractor')
+        if data_extractor is None:
+            return
+        data_extractor.release()
+
+        meta = {'thread_id': session.get('thread_id')}
+        with open(self._meta_path(user_id), 'w') as f:
+            json.dump(meta, f)
+
+    def _read_meta(self, user_id):
+        if not os.path.exists(self._meta_path(user_id)):
+            return {}
+        with open(self._meta_path(user_id)) as f:
+            return json.load(f)
+
+    def _rehydrate(self, user_id):
+        meta = self._read_meta(user_id)
+        data_extractor = DataExtractor.from_disk(user_id)
+        return self.session_factory(user_id, data_extractor, thread_id=meta.get('thread_id'))
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import TimeoutError
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Nodes that end the routing, announced to the client as the chosen route
+ROUTE_NODES = ('data_modification', 'process_na_values', 'create_analysis', 'create_graphics',
+               'help_user', 'prompt_unrelated', 'fast_path')
+# Nodes whose LLM output is the answer itself, the other LLM calls are classifications
+# or tool calls and their tokens are not forwarded
+ANSWER_NODES = ('help_user',)
+
+
+def sse_event(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class StreamEventsHandler(BaseCallbackHandler):
+    """
+    Turns the callbacks of an agent run into client events: node progress, the route
+    chosen, tool start/end and the answer tokens. emit(event) is called from the thread
+    running the graph and must be thread-safe.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.llm_nodes = {}
+        self.tool_names = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        # Every graph node runs as a chain named after it, '__start__' is internal
+        node = (metadata or {}).get('langgraph_node')
+        if node and kwargs.get('name') == node and not node.startswith('__'):
+            self.emit({'event': 'node', 'node': node})
+            if node == 'fast_path':
+                # Announce the leaf route the fast path stands for, as the /chat cache does
+                fast_call = inputs.get('fast_call') if isinstance(inputs, dict) else None
+                self.emit({'event': 'route', 'route': (fast_call or {}).get('route', node)})
+            elif node in ROUTE_NODES:
+                self.emit({'event': 'route', 'route': node})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.llm_nodes[run_id] = (metadata or {}).get('langgraph_node')
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token and self.llm_nodes.get(run_id) in ANSWER_NODES:
+            self.emit({'event': 'token', 'token': token})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.llm_nodes.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get('name') or kwargs.get('name')
+        self.tool_names[run_id] = name
+        self.emit({'event': 'tool_start', 'tool': name, 'input': input_str})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.emit({'event': 'tool_end', 'tool': self.tool_names.pop(run_id, None)})
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.emit({'event': 'tool_error', 'tool': self.tool_names.pop(run_id, None), 'error': str(error)})
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+def stream_from_thread(produce, *args, max_chunks=8):
+    """
+    Async generator of the chunks produced by produce(*args, emit) on a worker thread,
+    for a StreamingResponse. At most max_chunks wait for the client, a slow client
+    slows the producer down instead of the chunks piling up in memory, and the
+    producer is stopped (emit raises StreamCancelled) if the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_chunks)
+    cancelled = threading.Event()
+
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                return future.result(timeout=1)
+            except TimeoutError:
+                if cancelled.is_set():
+                    future.cancel()
+                    raise StreamCancelled()
+
+    def run():
+        try:
+            produce(*args, put)
+        except StreamCancelled:
+            return
+        finally:
+            # None marks the end, an error of produce is raised by the generator
+            if not cancelled.is_set():
+                put(None)
+
+    async def chunks():
+        future = loop.run_in_executor(None, run)
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+            await future
+        finally:
+            cancelled.set()
+
+    return chunks()
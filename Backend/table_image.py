@@ -0,0 +1,59 @@
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+# Small PNG rendering of a DataFrame preview, drawn directly with Pillow: no browser
+# and no matplotlib table, a few milliseconds for a head of the data.
+
+FONT_SIZE = 14
+PADDING_X, PADDING_Y = 10, 6
+MAX_CELL_CHARS = 30
+HEADER_COLOR = (230, 234, 240)
+STRIPE_COLOR = (247, 248, 250)
+LINE_COLOR = (200, 204, 210)
+TEXT_COLOR = (33, 37, 41)
+
+
+def cell_text(value):
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return ''
+    # Same precision as a pandas Styler
+    text = f"{value:.6f}" if isinstance(value, float) else str(value)
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + '…'
+
+
+def render_table(df: pd.DataFrame, image_path: str, caption: str = "Dataset Overview"):
+    font = ImageFont.load_default(size=FONT_SIZE)
+    header = [''] + [cell_text(col) for col in df.columns]
+    rows = [[cell_text(index)] + [cell_text(value) for value in row]
+            for index, row in zip(df.index, df.itertuples(index=False))]
+
+    # Column widths from the longest text of each column
+    widths = [
+        max(font.getlength(text) for text in column) + 2 * PADDING_X
+        for column in zip(header, *rows)
+    ]
+    row_height = FONT_SIZE + 2 * PADDING_Y
+    caption_height = row_height + PADDING_Y
+    width = int(sum(widths)) + 1
+    height = caption_height + row_height * (len(rows) + 1) + 1
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((PADDING_X, PADDING_Y), caption, font=font, fill=TEXT_COLOR)
+
+    for i, cells in enumerate([header] + rows):
+        top = caption_height + i * row_height
+        if i == 0 or i % 2 == 0:
+            draw.rectangle([0, top, width - 1, top + row_height], fill=HEADER_COLOR if i == 0 else STRIPE_COLOR)
+        left = 0
+        for j, (text, cell_width) in enumerate(zip(cells, widths)):
+            # Index and text left aligned, numbers right aligned
+            numeric = j > 0 and i > 0 and pd.api.types.is_number(df.iat[i - 1, j - 1])
+            x = left + cell_width - PADDING_X - font.getlength(text) if numeric else left + PADDING_X
+            draw.text((x, top + PADDING_Y), text, font=font, fill=TEXT_COLOR)
+            left += cell_width
+        draw.line([0, top, width - 1, top], fill=LINE_COLOR)
+    draw.line([0, height - 1, width - 1, height - 1], fill=LINE_COLOR)
+
+    image.save(image_path, optimize=False)
+    return image_path
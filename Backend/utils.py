@@ -1,49 +1,196 @@
 import pandas as pd
 import os
-import dataframe_image as dfi
+import json
 from typing import List
-import os
 import zipfile
 import shutil
+import tempfile
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+import config
+from chart_cache import chart_folder
+from table_image import render_table
 
-def dataframe_to_image(df: pd.DataFrame, file_name: str,user_id:str) -> str:
-    # Path to store the image
-    graphs_folder = f'./users_data/{user_id}/data_head'
-    if not os.path.exists(graphs_folder):
-        os.makedirs(graphs_folder)
-    
-    # Full path to the saved image
-    image_path = os.path.join(graphs_folder, file_name)
-
-    # Use dfi to export the DataFrame as an image and save it
-    # You can modify this line if you want to add more styling or options
-    styled_df = df.style.set_caption("Dataset Overview")
-    dfi.export(styled_df, image_path)  # Export without extra table styles
+def dataframe_to_image(df: pd.DataFrame, image_path: str) -> str:
+    # Drawn in-process with Pillow, see table_image
+    return render_table(df, image_path, caption="Dataset Overview")
 
+def data_head_image(data_extractor, user_id: str, rows: int = 5) -> str:
+    # Image of the first rows, cached per data fingerprint: it is only drawn again
+    # once the data has changed
+    head_folder = os.path.join(config.USERS_DATA_FOLDER, user_id, 'data_head')
+    image_path = os.path.join(head_folder, f"data_head_{data_extractor.fingerprint()[:16]}.png")
+    if not os.path.exists(image_path):
+        os.makedirs(head_folder, exist_ok=True)
+        # The images of previous data versions are not served anymore
+        for name in os.listdir(head_folder):
+            os.remove(os.path.join(head_folder, name))
+        dataframe_to_image(data_extractor.head(rows), image_path)
     return image_path
 
-def create_user_chart_zip(user_id: str) -> str:
-    # Directory where user's images are stored
-    user_image_folder = f'./users_data/{user_id}/charts'
-    print(user_image_folder)
-    # Check if the folder exists
+def data_head_json(data_extractor, rows: int = 5) -> dict:
+    # Preview the frontend can render itself
+    head = data_extractor.head(rows)
+    return {
+        'columns': [str(col) for col in head.columns],
+        'dtypes': {str(col): info['dtype'] for col, info in data_extractor.columns.items()},
+        'index': json.loads(head.index.to_series().to_json(orient='values', date_format='iso')),
+        'rows': json.loads(head.to_json(orient='values', date_format='iso')),
+        'row_count': data_extractor.row_count(),
+    }
+
+def chart_zip_path(user_id: str) -> str:
+    return os.path.join('./downloads', f'{user_id}_charts.zip')
+
+def list_user_charts(user_id: str) -> List[str]:
+    # Names of the user's rendered charts, charts still being written are skipped
+    user_image_folder = chart_folder(user_id)
     if not os.path.exists(user_image_folder):
         raise FileNotFoundError(f"No charts found for user {user_id}")
+    return sorted(name for name in os.listdir(user_image_folder)
+                  if name.endswith('.png') and not name.endswith('.tmp.png'))
 
-    # Path for the temporary ZIP file
-    zip_filename = f'{user_id}_charts.zip'
-    zip_filepath = os.path.join('./downloads', zip_filename)
-
-    # Create the downloads folder if it doesn't exist
-    os.makedirs('./downloads', exist_ok=True)
+def update_chart_zip(user_id: str, charts: List[str]):
+    # Chart names are content-addressed, an archived chart never changes. An existing
+    # archive is reused as it is or brought up to date by appending the new charts
+    # only. Returns its path, or None if it has to be rebuilt: there is none yet or it
+    # holds charts that were evicted since.
+    zip_filepath = chart_zip_path(user_id)
+    if not os.path.exists(zip_filepath):
+        return None
+    with zipfile.ZipFile(zip_filepath) as zipf:
+        archived = set(zipf.namelist())
+    if not archived <= set(charts):
+        return None
 
-    # Create ZIP file
-    with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-        for root, _, files in os.walk(user_image_folder):
-            for file in files:
-                file_path = os.path.join(root, file)
-                # Add each file to the zip file
-                zipf.write(file_path, arcname=os.path.relpath(file_path, user_image_folder))
+    new_charts = [name for name in charts if name not in archived]
+    if new_charts:
+        # Appended on a copy and swapped in, a download of the previous archive that
+        # is still being sent keeps reading the old file
+        tmp_path = zip_filepath + '.tmp'
+        shutil.copyfile(zip_filepath, tmp_path)
+        with zipfile.ZipFile(tmp_path, 'a', compression=zipfile.ZIP_STORED) as zipf:
+            write_charts(zipf, user_id, new_charts)
+        os.replace(tmp_path, zip_filepath)
+    return zip_filepath
 
+def build_chart_zip(user_id: str, charts: List[str], emit):
+    # Writes a new archive of the charts. Every chunk written to the file is also
+    # passed to emit(chunk), so the archive can be sent while it is being built.
+    # Written to a file of its own and swapped in when complete: builds running at the
+    # same time never mix, and an interrupted build (emit raising when the client
+    # leaves) leaves no partial archive behind.
+    zip_filepath = chart_zip_path(user_id)
+    os.makedirs(os.path.dirname(zip_filepath), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(zip_filepath), suffix='.zip.tmp', delete=False) as out:
+        try:
+            # PNGs are already compressed, they are stored as they are
+            with zipfile.ZipFile(TeeWriter(out, emit), 'w', compression=zipfile.ZIP_STORED) as zipf:
+                write_charts(zipf, user_id, charts)
+        except BaseException:
+            out.close()
+            os.remove(out.name)
+            raise
+    os.replace(out.name, zip_filepath)
     return zip_filepath
 
+def write_charts(zipf: zipfile.ZipFile, user_id: str, charts: List[str]):
+    for name in charts:
+        try:
+            zipf.write(os.path.join(chart_folder(user_id), name), arcname=name)
+        except FileNotFoundError:
+            # Evicted from the chart cache in the meantime
+            pass
+
+class TeeWriter:
+    # Unseekable file object for zipfile: writes go to the file and to emit(chunk).
+    # Without tell/seek zipfile writes the sizes after each entry instead of going back.
+    def __init__(self, out, emit):
+        self.out = out
+        self.emit = emit
+
+    def write(self, data):
+        self.out.write(data)
+        self.emit(bytes(data))
+        return len(data)
+
+    def flush(self):
+        self.out.flush()
+
+
+async def spool_upload(file: UploadFile, user_id: str) -> str:
+    # Copy the upload to the user's folder in fixed size chunks, so the raw
+    # bytes are never held in memory all at once. Every upload gets a file of its own,
+    # concurrent uploads of a user never write or delete each other's. The caller
+    # removes it once parsed.
+    user_folder = os.path.join(config.USERS_DATA_FOLDER, user_id)
+    os.makedirs(user_folder, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=user_folder, prefix='upload_', suffix='.csv', delete=False) as out:
+        try:
+            while True:
+                chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(out.write, chunk)
+        except BaseException:
+            out.close()
+            os.remove(out.name)
+            raise
+
+    return out.name
+
+def read_csv_file(csv_path: str, mode: str = None) -> pd.DataFrame:
+    # Parse a spooled CSV incrementally. Blocking, call it from a worker thread.
+    # The rows are read batch by batch into Arrow, only converted to pandas at the end
+    # with self_destruct, which frees each Arrow column as soon as it is converted:
+    # the upload never holds two full copies of the data.
+    mode = mode or config.CSV_INGESTION_MODE
+    if mode == 'pyarrow':
+        try:
+            reader = pa_csv.open_csv(
+                csv_path,
+                read_options=pa_csv.ReadOptions(block_size=config.CSV_BLOCK_BYTES),
+                convert_options=pa_csv.ConvertOptions(strings_can_be_null=True),
+            )
+            return arrow_to_pandas([pa.Table.from_batches([batch]) for batch in reader])
+        except pa.ArrowInvalid as e:
+            # Arrow infers the schema from the first block, mixed columns need pandas
+            print(f"pyarrow CSV reader failed ({e}), falling back to chunked pandas")
+
+    # Every pandas chunk is converted to Arrow and dropped before the next one is read
+    tables = [chunk_to_arrow(chunk) for chunk in pd.read_csv(csv_path, chunksize=config.CSV_CHUNK_ROWS)]
+    return arrow_to_pandas(tables)
+
+def chunk_to_arrow(chunk: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Text columns holding numbers too (pandas read the mixed values as they came),
+        # their values are kept as text
+        for col in chunk.columns[chunk.dtypes == object]:
+            chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+
+def arrow_to_pandas(tables) -> pd.DataFrame:
+    if not tables:
+        return pd.DataFrame()
+    # Chunks can disagree on a type: numbers are widened (int to float once a chunk has
+    # missing values), anything else that does not match is read as text
+    fields = []
+    for i, name in enumerate(tables[0].column_names):
+        types = {table.schema.field(i).type for table in tables}
+        try:
+            field = pa.unify_schemas([pa.schema([pa.field(name, t)]) for t in types], promote_options='permissive').field(0)
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            field = pa.field(name, pa.string())
+        fields.append(field)
+    schema = pa.schema(fields)
+    for i, table in enumerate(tables):
+        if table.schema != schema:
+            tables[i] = table.cast(schema)
+    table = pa.concat_tables(tables)
+    tables.clear()
+    return table.to_pandas(split_blocks=True, self_destruct=True)